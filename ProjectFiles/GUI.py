@@ -1,7 +1,14 @@
 
+import queue
+import time
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import messagebox, ttk
-from logic import CommandManualGenerator, ManualVerifier, get_info_for_selection
+from command_browser import CommandBrowser
+from logic import (AsyncProbeBackend, CommandManualGenerator, ManualVerifier, get_info_for_selection,
+                   search_index_path, search_manuals)
+from manual_store import ManualStore
+from probe_cache import ProbeCache
 
 
 class ManualViewerApp:
@@ -13,27 +20,58 @@ class ManualViewerApp:
         self.selected_command = tk.StringVar()
         self.choice_var = tk.StringVar()
 
+        # Probe outputs are kept next to the manuals folder and reused while the commands do not change
+        self.cache = ProbeCache("probe_cache.sqlite")
+        # All the probes of a run are started together and none of them may hang the application
+        self.backend = AsyncProbeBackend(concurrency=16, timeout=30)
+        # Searching and verifying read the manuals from one indexed file instead of parsing the XML files
+        self.store = ManualStore("manuals.sqlite")
+
+        # Generation and verification run on this thread so the window keeps responding
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.events = queue.Queue()  # progress and results sent back by the running job
+        self.job = None  # generator or verifier currently running
+        self.job_started = 0
+
         # Create and configure widgets
         self.create_widgets()
 
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+
     def create_widgets(self):
         # Generate manuals button
-        generate_manuals_btn = tk.Button(self.master, text="Generate Manuals", command=self.generate_manuals)
-        generate_manuals_btn.pack(pady=10)
+        self.generate_manuals_btn = tk.Button(self.master, text="Generate Manuals", command=self.generate_manuals)
+        self.generate_manuals_btn.pack(pady=10)
 
         # Verify manuals button
         self.verify_manuals_btn = tk.Button(self.master, text="Verify Manuals", command=self.verify_manuals)
         self.verify_manuals_btn.pack(pady=10)
 
-        # Dropdown list for commands (initially disabled)
-        self.command_dropdown = ttk.Combobox(self.master, textvariable=self.selected_command, state="readonly")
-        self.command_dropdown.pack(pady=10)
-        # Set a default prompt for the dropdown list
-        self.command_dropdown.set("Choose Command")
+        # Progress bar and cancel button of the running job
+        progress_frame = tk.Frame(self.master)
+        progress_frame.pack()
+
+        self.progress_bar = ttk.Progressbar(progress_frame, length=400, mode="determinate")
+        self.progress_bar.pack(side=tk.LEFT)
+
+        self.cancel_btn = tk.Button(progress_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+
+        self.progress_label = tk.Label(self.master, text="")
+        self.progress_label.pack()
+
+        # Commands list and manual display side by side. The list is filtered as you type and only draws the rows
+        # on screen, the manuals around them are loaded into the store's cache before they are chosen
+        browse_frame = tk.Frame(self.master)
+        browse_frame.pack(pady=10)
+
+        self.command_browser = CommandBrowser(browse_frame, on_select=self.command_selected,
+                                              prefetch=self.store.prefetch, rows=12, width=30)
+        self.command_browser.pack(side=tk.LEFT, fill=tk.Y, padx=5)
 
         # Manual display text box
-        self.manual_display = tk.Text(self.master, wrap=tk.WORD, height=15, width=60, state=tk.DISABLED)
-        self.manual_display.pack(pady=10)
+        self.manual_display = tk.Text(browse_frame, wrap=tk.WORD, height=15, width=60, state=tk.DISABLED)
+        self.manual_display.pack(side=tk.LEFT)
 
         # Radio buttons for user choice (initially disabled)
         radio_frame = tk.Frame(self.master)
@@ -69,12 +107,35 @@ class ManualViewerApp:
         self.search_btn = tk.Button(self.master, text="Search", command=self.display_manual_info, state=tk.DISABLED)
         self.search_btn.pack(pady=5)
 
+        # Full-text search over every generated manual, answered by the index written at generation time
+        find_frame = tk.Frame(self.master)
+        find_frame.pack(pady=5)
+
+        self.find_entry = tk.Entry(find_frame, width=40)
+        self.find_entry.pack(side=tk.LEFT)
+        self.find_entry.bind("<Return>", lambda event: self.find_manuals())
+
+        self.find_btn = tk.Button(find_frame, text="Find in Manuals", command=self.find_manuals)
+        self.find_btn.pack(side=tk.LEFT, padx=5)
+
     def generate_manuals(self):
-        generator = CommandManualGenerator("input_commands.txt")
-        c = generator.generate_manuals()
+        generator = CommandManualGenerator("input_commands.txt", timeout=30, cache=self.cache, backend=self.backend,
+                                           store=self.store, progress=self.on_progress,
+                                           search_index_file=search_index_path("manuals_folder"))
+        self.start_job(generator, generator.generate_manuals, self.generation_finished)
 
+    def generation_finished(self, generator, c):
         if type(c) is str:
             self.show_message("ERROR", c, is_error=True)
+        elif generator.cancelled:
+            self.commands = c
+            self.show_message("Cancelled", f"Generation cancelled after {generator.done} of {len(c)} commands.")
+        elif generator.errors:
+            self.commands = c
+            f_message = ""
+            for command, error in generator.errors.items():
+                f_message += f"{command}: {error}\n"
+            self.show_message("Generation Errors", f_message, is_error=True)
         else:
             self.commands = c
             self.show_message("SUCCESS", "Manuals generated successfully.")
@@ -83,11 +144,11 @@ class ManualViewerApp:
         selected_command = self.selected_command.get()
         user_choice = self.choice_var.get()
 
-        if not selected_command or selected_command == "Choose Command":
+        if not selected_command:
             self.show_message("Attention", "Please select a valid command to display.")
             return
 
-        info = get_info_for_selection(selected_command, user_choice)
+        info = get_info_for_selection(selected_command, user_choice, store=self.store)
 
         # Enable the Text widget for writing
         self.manual_display.config(state=tk.NORMAL)
@@ -98,6 +159,37 @@ class ManualViewerApp:
         # Disable the Text widget to prevent user input
         self.manual_display.config(state=tk.DISABLED)
 
+    def command_selected(self, command):
+        self.selected_command.set(command)
+
+        # Once the manuals are verified, choosing a command shows it right away
+        if str(self.search_btn['state']) == tk.NORMAL:
+            self.display_manual_info()
+
+    def find_manuals(self):
+        query = self.find_entry.get().strip()
+        if not query:
+            return
+
+        results = search_manuals(query, search_index_path("manuals_folder"))
+
+        if type(results) is str:
+            info = f"{results}\nGenerate the manuals to build the search index."
+        elif not results:
+            info = f"No manual matches '{query}'"
+        else:
+            info = ""
+            for command, score in results:
+                command_data = self.store.get(command)
+                description = command_data['CommandDescription'] if command_data else ""
+                summary = description.strip().split('\n')[0] if description else ""
+                info += f"{command}  ({score:.2f})\n    {summary}\n\n"
+
+        self.manual_display.config(state=tk.NORMAL)
+        self.manual_display.delete(1.0, tk.END)
+        self.manual_display.insert(tk.END, info)
+        self.manual_display.config(state=tk.DISABLED)
+
     def verify_manuals(self):
 
         generator = CommandManualGenerator("input_commands.txt")
@@ -108,41 +200,126 @@ class ManualViewerApp:
         else:
             self.commands = c
 
-            verifier = ManualVerifier("manuals_folder", "input_commands.txt")
-            verification_messages = verifier.verify_manuals(self.commands)
+            verifier = ManualVerifier("manuals_folder", "input_commands.txt", timeout=30, cache=self.cache,
+                                      backend=self.backend, store=self.store, progress=self.on_progress)
+            self.start_job(verifier, lambda: verifier.verify(c), self.verification_finished)
 
-            success_message = []
-            error_message = []
+    def verification_finished(self, verifier, report):
+        if verifier.cancelled:
+            self.show_message("Cancelled", f"Verification cancelled after {verifier.done} of "
+                                           f"{len(self.commands)} commands.")
+            return
 
-            for message in verification_messages:
-                if message.endswith("successfully"):
-                    success_message.append(message)
-                else:
-                    error_message.append(message)
+        if report.error is not None:
+            self.show_message("Verification Errors", report.error, is_error=True)
+            self.disable_search_button()
+            return
 
-            s_message = ""
-            f_message = ""
+        failed = report.failed()
+
+        # The dialogs only show the totals, the details go to the text box where they can be scrolled
+        details = ""
+        for result in failed:
+            details += result.message() + "\n"
+
+        self.manual_display.config(state=tk.NORMAL)
+        self.manual_display.delete(1.0, tk.END)
+        self.manual_display.insert(tk.END, report.summary() + "\n" + details)
+        self.manual_display.config(state=tk.DISABLED)
+
+        if failed:
+            self.show_message("Verification Errors", report.summary() + "\n\nThe details are shown in the text box.",
+                              is_error=True)
+            self.disable_search_button()  # Disable the search button in case of verification errors
+            self.show_message("Attention", "you should regenerate the manuals", is_error=True)
+        else:
+            self.show_message("Verification Success", f"{len(report.passed())} manuals verified successfully.")
+
+        if len(report.passed()) == len(self.commands):
+            self.enable_search_button()  # Enable the search button
+
+            # Populate the commands list with generated commands
+            self.command_browser.set_commands(self.commands)
+
+    def start_job(self, job, function, finished):
+        # Drop the late progress of the previous job
+        while not self.events.empty():
+            self.events.get_nowait()
+
+        self.job = job
+        self.job_started = time.monotonic()
+        self.set_job_running(True)
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="Starting...")
+
+        # The result is handed back through the queue, only the Tk thread touches the widgets
+        future = self.executor.submit(function)
+        future.add_done_callback(lambda done: self.events.put(("finished", finished, done)))
+
+        self.master.after(100, self.poll_job)
+
+    def on_progress(self, done, total, command):
+        # Called from the job's threads
+        self.events.put(("progress", done, total, command))
+
+    def poll_job(self):
+        progress = None
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                progress = event[1:]  # only the latest progress is shown
+                continue
+
+            _, finished, future = event
+            job = self.job
+            self.job = None
+            self.set_job_running(False)
+            self.progress_label.config(text="")
+
+            try:
+                result = future.result()
+            except Exception as error:
+                self.show_message("ERROR", f"{type(error).__name__}: {error}", is_error=True)
+            else:
+                finished(job, result)
+            return
 
-            if len(success_message) != 0:
-                for m in success_message:
-                    s_message += m
-                    s_message += "\n"
-                self.show_message("Verification Success", s_message)
-
-            if len(error_message) != 0:
-                for m in error_message:
-                    f_message += m
-                    f_message += "\n"
-                self.show_message("Verification Errors", f_message, is_error=True)
-                self.disable_search_button()  # Disable the search button in case of verification errors
-                self.show_message("Attention", "you should regenerate the manuals", is_error=True)
-
-            if len(success_message) == len(self.commands):
-                self.enable_search_button()  # Enable the search button
-
-                self.command_dropdown.config(state="readonly")
-                # Populate the dropdown list with generated commands
-                self.command_dropdown['values'] = self.commands
+        if progress is not None:
+            self.show_progress(*progress)
+
+        self.master.after(100, self.poll_job)
+
+    def show_progress(self, done, total, command):
+        elapsed = time.monotonic() - self.job_started
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = int((total - done) / rate) if rate > 0 else 0
+
+        self.progress_bar.config(maximum=max(total, 1), value=done)
+        self.progress_label.config(text=f"{done}/{total} commands  {rate:.1f} commands/s  "
+                                        f"ETA {eta // 60}:{eta % 60:02d}  ({command})")
+
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.progress_label.config(text="Cancelling...")
+
+    def set_job_running(self, running):
+        state = tk.DISABLED if running else tk.NORMAL
+        self.generate_manuals_btn.config(state=state)
+        self.verify_manuals_btn.config(state=state)
+        self.cancel_btn.config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def close(self):
+        # Stop the running job so its thread does not keep the application alive
+        if self.job is not None:
+            self.job.cancel()
+        self.executor.shutdown(wait=False)
+        self.master.destroy()
 
     def enable_search_button(self):
         self.search_btn.config(state=tk.NORMAL)  # Enable the search button
@@ -0,0 +1,283 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from logic import (AproposIndex, AsyncProbeBackend, CommandManual, CommandManualGenerator, CommandProbe,
+                   ManualVerifier, XmlSerializer, get_info_for_selection)
+from manual_store import ManualStore
+
+
+# Answers every probe of a fake command and counts each call in $BENCH_COUNT_FILE
+FAKE_COMMAND = """#!/bin/sh
+echo "$(basename "$0") $1" >> "$BENCH_COUNT_FILE"
+sleep "$BENCH_LATENCY"
+case "$1" in
+    --version) echo "$(basename "$0") (bench utils) 1.0" ;;
+    -v) exit 1 ;;
+    --help) printf 'Usage: %s [OPTION]...\\nA fake command for the benchmark.\\n' "$(basename "$0")" ;;
+    *) echo "ran $(basename "$0")" ;;
+esac
+"""
+
+FAKE_MAN = """#!/bin/sh
+echo "man $*" >> "$BENCH_COUNT_FILE"
+sleep "$BENCH_LATENCY"
+if [ "$1" = "-k" ]; then
+    if [ "$2" = "." ]; then
+        cat "$BENCH_WHATIS"
+    else
+        grep -i -- "$2" "$BENCH_WHATIS" || exit 16
+    fi
+    exit 0
+fi
+[ -e "$BENCH_MAN_DIR/man1/$1.1" ] || exit 16
+printf '%s(1)        User Commands        %s(1)\\n\\nNAME\\n       %s - fake command %s\\n\\n' "$1" "$1" "$1" "$1"
+printf 'SYNOPSIS\\n       %s [OPTION]... [FILE]...\\n\\n' "$1"
+printf 'DESCRIPTION\\n       The %s command exists for the benchmark.\\n       It prints nothing useful.\\n\\n' "$1"
+printf '       A second paragraph of the description.\\n\\nOPTIONS\\n       -a, --all\\n              everything\\n'
+"""
+
+
+class FakeCommandSandbox:
+    # A temporary PATH and MANPATH with stub commands whose probes sleep for a configurable latency
+
+    def __init__(self, size, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.root = tempfile.mkdtemp(prefix="manual_bench_")
+        self.bin_dir = os.path.join(self.root, "bin")
+        self.man_dir = os.path.join(self.root, "man")
+        self.count_file = os.path.join(self.root, "calls.log")
+        self.whatis_file = os.path.join(self.root, "whatis")
+        self.commands = [f"benchcmd{i:05d}" for i in range(size)]
+        self.saved_environment = {}
+
+    def __enter__(self):
+        os.makedirs(self.bin_dir)
+        os.makedirs(os.path.join(self.man_dir, "man1"))
+
+        fake_command = os.path.join(self.root, "fake_command")
+        self.write_script(fake_command, FAKE_COMMAND)
+        self.write_script(os.path.join(self.bin_dir, "man"), FAKE_MAN)
+
+        with open(self.whatis_file, 'w') as whatis:
+            for command in self.commands:
+                os.symlink(fake_command, os.path.join(self.bin_dir, command))
+                with open(os.path.join(self.man_dir, "man1", f"{command}.1"), 'w') as page:
+                    page.write(f".TH {command} 1\n")
+                whatis.write(f"{command} (1)        - fake command {command}\n")
+
+        open(self.count_file, 'w').close()
+
+        environment = {
+            "PATH": self.bin_dir + os.pathsep + os.environ.get("PATH", ""),
+            "MANPATH": self.man_dir,
+            "BENCH_COUNT_FILE": self.count_file,
+            "BENCH_LATENCY": str(self.latency),
+            "BENCH_WHATIS": self.whatis_file,
+            "BENCH_MAN_DIR": self.man_dir,
+        }
+        for key, value in environment.items():
+            self.saved_environment[key] = os.environ.get(key)
+            os.environ[key] = value
+
+        return self
+
+    def __exit__(self, *exc_info):
+        for key, value in self.saved_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    @staticmethod
+    def write_script(path, content):
+        with open(path, 'w') as script:
+            script.write(content)
+        os.chmod(path, 0o755)
+
+    def subprocess_count(self):
+        with open(self.count_file, 'rb') as calls:
+            return sum(1 for _ in calls)
+
+    def write_input_file(self):
+        path = os.path.join(self.root, "input_commands.txt")
+        with open(path, 'w') as input_file:
+            input_file.write("\n".join(self.commands) + "\n")
+        return path
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": at(0.50) * 1000,
+        "p90_ms": at(0.90) * 1000,
+        "p99_ms": at(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux. It is the high-water mark of the whole process, which is why every
+    # size runs in a process of its own. The children figure counts each forked probe before its exec, so it is
+    # about the interpreter's own size rather than what the fake commands used
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+class StageTimer:
+    # Collects the latency of every call of a stage and the subprocesses the stage started
+
+    def __init__(self, sandbox):
+        self.sandbox = sandbox
+        self.stages = {}
+
+    def measure(self, stage, function, items):
+        samples = []
+        calls_before = self.sandbox.subprocess_count()
+        started = time.perf_counter()
+
+        results = []
+        for item in items:
+            call_started = time.perf_counter()
+            results.append(function(item))
+            samples.append(time.perf_counter() - call_started)
+
+        wall = time.perf_counter() - started
+        subprocesses = self.sandbox.subprocess_count() - calls_before
+
+        self.stages[stage] = dict(percentiles(samples), wall_s=wall,
+                                  subprocesses=subprocesses,
+                                  subprocesses_per_item=subprocesses / len(samples) if samples else 0)
+        return results
+
+    def measure_run(self, stage, function, items_count):
+        calls_before = self.sandbox.subprocess_count()
+        started = time.perf_counter()
+        function()
+        wall = time.perf_counter() - started
+        subprocesses = self.sandbox.subprocess_count() - calls_before
+
+        self.stages[stage] = {
+            "items": items_count,
+            "wall_s": wall,
+            "throughput_per_s": items_count / wall if wall > 0 else 0,
+            "subprocesses": subprocesses,
+            "subprocesses_per_item": subprocesses / items_count if items_count else 0,
+        }
+
+
+def benchmark_size(size, latency, sample, mode, workers, concurrency):
+    with FakeCommandSandbox(size, latency) as sandbox:
+        timer = StageTimer(sandbox)
+        output_folder = os.path.join(sandbox.root, "manuals_folder")
+        input_file = sandbox.write_input_file()
+        sampled = sandbox.commands[:sample]
+
+        # Per-command latencies on a sample, so large catalogues stay affordable
+        apropos_index = AproposIndex()
+        apropos_index.load()
+
+        def generate(command):
+            return CommandManual(command, probe=CommandProbe(command, apropos_index=apropos_index)).generate_manual()
+
+        manuals = timer.measure("generate_manual", generate, sampled)
+        timer.measure("create_xml", lambda manual_data: XmlSerializer(manual_data, output_folder).create_xml(),
+                      manuals)
+
+        # Whole catalogue through the generator, the way the GUI and the nightly jobs run it
+        store = ManualStore(os.path.join(sandbox.root, "manuals.sqlite"))
+        backend = AsyncProbeBackend(concurrency=concurrency) if mode == "async" else None
+        generator = CommandManualGenerator(input_file, workers=workers if mode == "threads" else 1,
+                                           output_folder=output_folder, backend=backend, store=store)
+        timer.measure_run("generate_manuals", generator.generate_manuals, size)
+
+        verifier = ManualVerifier(output_folder, input_file, apropos_index=apropos_index)
+        timer.measure("verify_manuals", lambda command: verifier.verify_manuals([command]), sampled)
+
+        fast_verifier = ManualVerifier(output_folder, input_file, apropos_index=apropos_index, fast=True,
+                                       workers=workers)
+        timer.measure_run("verify_manuals_fast", lambda: fast_verifier.verify_manuals(sandbox.commands), size)
+
+        timer.measure("get_info_for_selection_xml",
+                      lambda command: get_info_for_selection(command, "Show All Info", manuals_folder=output_folder),
+                      sampled)
+        timer.measure("get_info_for_selection_store",
+                      lambda command: get_info_for_selection(command, "Show All Info", store=store), sampled)
+
+        store.close()
+
+        return {
+            "size": size,
+            "latency_s": latency,
+            "mode": mode,
+            "errors": len(generator.errors),
+            "stages": timer.stages,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark manual generation, serialization, verification "
+                                                 "and lookup against fake commands")
+    parser.add_argument("--sizes", default="20,100,1000",
+                        help="comma separated catalogue sizes, for example 20,1000,10000")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every fake probe sleeps")
+    parser.add_argument("--sample", type=int, default=100,
+                        help="commands whose single-command latencies are measured")
+    parser.add_argument("--mode", choices=["serial", "threads", "async"], default="async",
+                        help="how generate_manuals runs the probes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=16, help="probes run together by the async backend")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": sys.version.split()[0],
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": [],
+    }
+
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        # A fresh interpreter per size, so the peak RSS is the one of this size and not the largest so far
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            run = executor.submit(benchmark_size, size, args.latency, args.sample, args.mode, args.workers,
+                                  args.concurrency).result()
+        results["runs"].append(run)
+
+        generation = run["stages"]["generate_manuals"]
+        print(f"{size} commands: generate_manuals {generation['wall_s']:.2f}s "
+              f"({generation['throughput_per_s']:.1f}/s, {generation['subprocesses_per_item']:.1f} subprocesses "
+              f"per command), peak RSS {run['peak_rss_kb']['self']} KB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
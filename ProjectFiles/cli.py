@@ -0,0 +1,320 @@
+import argparse
+import json
+import sys
+
+from command_input import parse_shard
+from logic import (AsyncProbeBackend, CommandManualGenerator, ManualVerifier, find_manual, get_info_for_selection,
+                   merge_output_folders, search_index_path, search_manuals)
+from manual_store import ManualStore
+from manual_record import MANUAL_FIELDS
+from probe_cache import ProbeCache
+from snapshots import SnapshotStore, environment_tag
+from tracing import ProbeTracer
+
+# Command line driver for cron jobs and containers, it never imports tkinter
+
+# --field -> (selection of format_selection, key of the manual data)
+SELECTIONS = {
+    "all": ("Show All Info", None),
+    "description": ("Show Description", "CommandDescription"),
+    "version": ("Show Version", "VersionHistory"),
+    "example": ("Show Example", "Example"),
+    "related": ("Show Related Commands", "RelatedCommands"),
+    "links": ("Show Online Documentation Links", "OnlineDocumentationLinks"),
+    "recommended": ("Show Recommended Commands", "RecommendedCommands"),
+}
+
+
+def print_progress(done, total, command):
+    print(f"{done}/{total} {command}", file=sys.stderr)
+
+
+def open_cache(args):
+    return ProbeCache(args.cache) if args.cache else None
+
+
+def open_store(args):
+    return ManualStore(args.store) if args.store else None
+
+
+def make_backend(args):
+    # Without concurrency the probes run on the worker threads
+    return AsyncProbeBackend(concurrency=args.concurrency, timeout=args.timeout) if args.concurrency > 0 else None
+
+
+def index_file(args):
+    # The index of the --output folder unless --search-index names another file, empty skips it when generating
+    return search_index_path(args.output) if args.search_index is None else args.search_index or None
+
+
+def print_result(args, result, text):
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print(text)
+
+
+def generate(args):
+    cache = open_cache(args)
+    store = open_store(args)
+    tracer = ProbeTracer(jsonl_path=args.trace) if args.trace else None
+    snapshot_store = SnapshotStore(args.snapshots) if args.snapshots else None
+
+    generator = CommandManualGenerator(args.input, workers=args.workers, timeout=args.timeout, cache=cache,
+                                       output_folder=args.output, incremental=args.incremental,
+                                       backend=make_backend(args), combined_file=args.combined, store=store,
+                                       xml_files=not args.no_xml, progress=print_progress if args.progress else None,
+                                       tracer=tracer, shard=args.shard, search_index_file=index_file(args),
+                                       snapshot_store=snapshot_store, environment=environment_tag(args.label))
+    try:
+        commands = generator.generate_manuals()
+    finally:
+        for resource in (cache, store, tracer, snapshot_store):
+            if resource is not None:
+                resource.close()
+
+    if type(commands) is str:
+        print_result(args, {"error": commands}, commands)
+        return 2
+
+    result = {
+        "commands": len(commands),
+        "generated": len(commands) - len(generator.skipped) - len(generator.errors),
+        "skipped": generator.skipped,
+        "errors": generator.errors,
+        "output_folder": args.output,
+        "snapshot": generator.snapshot,
+    }
+    text = f"{result['generated']} manuals generated, {len(generator.skipped)} unchanged, " \
+           f"{len(generator.errors)} failed"
+    for command, error in generator.errors.items():
+        text += f"\n{command}: {error}"
+
+    print_result(args, result, text)
+    return 1 if generator.errors else 0
+
+
+def verify(args):
+    generator = CommandManualGenerator(args.input, shard=args.shard)
+    commands = generator.read_commands_from_file()
+
+    if type(commands) is str:
+        print_result(args, {"error": commands}, commands)
+        return 2
+
+    cache = open_cache(args)
+    store = open_store(args)
+    tracer = ProbeTracer(jsonl_path=args.trace) if args.trace else None
+
+    verifier = ManualVerifier(args.output, args.input, timeout=args.timeout, cache=cache,
+                              backend=make_backend(args), store=store, workers=args.workers, fast=args.fast,
+                              max_mismatches=args.max_mismatches,
+                              progress=print_progress if args.progress else None, tracer=tracer)
+    try:
+        report = verifier.verify(commands)
+    finally:
+        for resource in (cache, store, tracer):
+            if resource is not None:
+                resource.close()
+
+    if args.report:
+        report.write(args.report, args.report_format)
+
+    if report.error is not None:
+        print_result(args, {"error": report.error}, report.error)
+        return 2
+
+    text = "\n".join(result.message().strip() for result in report.failed())
+    print_result(args, report.to_dict(), (text + "\n\n" if text else "") + report.summary())
+    return 0 if report.ok else 1
+
+
+def query(args):
+    store = open_store(args)
+    selection, key = SELECTIONS[args.field]
+
+    # The same lookup as the GUI, only the JSON output reads the fields itself
+    try:
+        command_data, error = find_manual(args.command, store, args.output)
+        if command_data is None:
+            print_result(args, {"error": error}, error)
+            return 2
+
+        if args.json:
+            if key is not None:
+                result = {'CommandName': command_data['CommandName'], key: command_data[key]}
+            else:
+                result = command_data.to_dict()
+            print_result(args, result, None)
+        else:
+            print(get_info_for_selection(args.command, selection, store=store, manuals_folder=args.output))
+    finally:
+        if store is not None:
+            store.close()
+
+    return 0
+
+
+def search(args):
+    results = search_manuals(" ".join(args.words), index_file(args), args.limit)
+
+    if type(results) is str:
+        print_result(args, {"error": results}, results)
+        return 2
+
+    print_result(args, [{"command": command, "score": score} for command, score in results],
+                 "\n".join(f"{command}\t{score:.3f}" for command, score in results))
+    return 0
+
+
+def list_snapshots(args):
+    snapshot_store = SnapshotStore(args.snapshots)
+    try:
+        snapshots = snapshot_store.snapshots()
+    finally:
+        snapshot_store.close()
+
+    print_result(args, snapshots, "\n".join(f"{snapshot['id']}\t{snapshot['label']}\t{snapshot['commands']} commands"
+                                             for snapshot in snapshots))
+    return 0
+
+
+def diff_snapshots(args):
+    snapshot_store = SnapshotStore(args.snapshots)
+    try:
+        report = snapshot_store.diff(snapshot_store.find(args.old), snapshot_store.find(args.new))
+    except KeyError as error:
+        print_result(args, {"error": error.args[0]}, error.args[0])
+        return 2
+    finally:
+        snapshot_store.close()
+
+    text = "\n".join(result.message().strip() for result in report.results)
+    print_result(args, report.to_dict(), (text + "\n\n" if text else "") + report.summary())
+    return 0 if report.ok else 1
+
+
+def drift(args):
+    snapshot_store = SnapshotStore(args.snapshots)
+    try:
+        if args.snapshot_names:
+            snapshots = [snapshot_store.find(name) for name in args.snapshot_names]
+        else:
+            snapshots = [snapshot['id'] for snapshot in snapshot_store.snapshots()]
+        drifting = snapshot_store.drift(snapshots, args.field)
+    except KeyError as error:
+        print_result(args, {"error": error.args[0]}, error.args[0])
+        return 2
+    finally:
+        snapshot_store.close()
+
+    text = ""
+    for command, values in drifting.items():
+        text += f"{command}\n"
+        for value, snapshot_ids in values.items():
+            text += f"    {value}: snapshots {', '.join(str(snapshot) for snapshot in snapshot_ids)}\n"
+
+    print_result(args, drifting, text + f"{len(drifting)} commands differ in {args.field}")
+    return 0
+
+
+def merge(args):
+    store = open_store(args)
+    try:
+        merged = merge_output_folders(args.shard_folders, args.output, store)
+    finally:
+        if store is not None:
+            store.close()
+
+    print_result(args, {"merged": merged, "output_folder": args.output},
+                 f"{merged} manuals merged into {args.output}")
+    return 0
+
+
+def add_run_arguments(parser):
+    parser.add_argument("--input", nargs="+", default=["input_commands.txt"],
+                        help="files with one command per line, - reads stdin")
+    parser.add_argument("--shard", type=parse_shard, help="only handle shard i of N, for example 2/8")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="threads probing the commands, only with --concurrency 0 (the asyncio backend probes "
+                             "them otherwise)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="probes run together by the asyncio backend, 0 runs them on the worker threads")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds allowed for each probe")
+    parser.add_argument("--cache", default="probe_cache.sqlite", help="probe cache file, empty to disable")
+    parser.add_argument("--trace", help="write a JSON line per probe and a summary of the run to this file")
+    parser.add_argument("--progress", action="store_true", help="print every finished command to stderr")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate, verify and query command manuals without the GUI")
+    parser.add_argument("--output", default="manuals_folder", help="folder of the XML manuals")
+    parser.add_argument("--store", help="ManualStore file (for example manuals.sqlite) kept next to the XML files")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="generate the manuals of the input commands")
+    add_run_arguments(generate_parser)
+    generate_parser.add_argument("--incremental", action="store_true",
+                                 help="only regenerate the commands whose binary or man page changed")
+    generate_parser.add_argument("--combined", help="also write every manual into this single XML file")
+    generate_parser.add_argument("--search-index",
+                                 help="full-text index written after the run, manuals_search.idx in --output by "
+                                      "default, empty to skip it")
+    generate_parser.add_argument("--snapshots", help="also record the run as a snapshot in this file")
+    generate_parser.add_argument("--label", help="label of the snapshot, the host, distro and time by default")
+    generate_parser.add_argument("--no-xml", action="store_true",
+                                 help="do not write one XML file per command, needs --store")
+    generate_parser.set_defaults(function=generate)
+
+    verify_parser = subparsers.add_parser("verify", help="compare the manuals with freshly probed content")
+    add_run_arguments(verify_parser)
+    verify_parser.add_argument("--fast", action="store_true",
+                               help="only probe the commands whose fingerprint changed")
+    verify_parser.add_argument("--max-mismatches", type=int, help="stop after this many failed manuals")
+    verify_parser.add_argument("--report", help="also write the report to this file")
+    verify_parser.add_argument("--report-format", choices=["json", "junit"], default="json")
+    verify_parser.set_defaults(function=verify)
+
+    query_parser = subparsers.add_parser("query", help="print a field of a generated manual")
+    query_parser.add_argument("command")
+    query_parser.add_argument("--field", choices=sorted(SELECTIONS), default="all")
+    query_parser.set_defaults(function=query)
+
+    search_parser = subparsers.add_parser("search", help="rank the manuals that contain the given words")
+    search_parser.add_argument("words", nargs="+")
+    search_parser.add_argument("--search-index", help="index written by generate, the one in --output by default")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.set_defaults(function=search)
+
+    snapshots_parser = subparsers.add_parser("snapshots", help="list the recorded snapshots")
+    snapshots_parser.add_argument("--snapshots", default="snapshots.sqlite")
+    snapshots_parser.set_defaults(function=list_snapshots)
+
+    diff_parser = subparsers.add_parser("diff", help="per field changes between two snapshots, ids or labels")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--snapshots", default="snapshots.sqlite")
+    diff_parser.set_defaults(function=diff_snapshots)
+
+    drift_parser = subparsers.add_parser("drift", help="commands whose field differs between snapshots")
+    drift_parser.add_argument("snapshot_names", nargs="*", help="ids or labels, every snapshot by default")
+    drift_parser.add_argument("--field", choices=MANUAL_FIELDS, default="VersionHistory")
+    drift_parser.add_argument("--snapshots", default="snapshots.sqlite")
+    drift_parser.set_defaults(function=drift)
+
+    merge_parser = subparsers.add_parser("merge", help="merge the output folders of sharded runs into --output")
+    merge_parser.add_argument("shard_folders", nargs="+")
+    merge_parser.set_defaults(function=merge)
+
+    args = parser.parse_args(argv)
+
+    if args.action == "generate" and args.no_xml and not args.store:
+        parser.error("--no-xml needs --store")
+
+    return args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import tkinter as tk
+
+# Milliseconds to wait after the last key before the list is filtered, so typing a word filters once
+DEBOUNCE_MS = 150
+
+
+class CommandFilter:
+    # Case-insensitive substring filter of the command names. When the query only grows, as it does while typing,
+    # the next filter only checks the commands that matched the previous one
+
+    def __init__(self, commands=()):
+        self.set_commands(commands)
+
+    def set_commands(self, commands):
+        self.commands = list(commands)
+        self.lowered = [command.lower() for command in self.commands]
+        self.query = ""
+        self.indices = list(range(len(self.commands)))  # positions of the matching commands, in list order
+        self.matches = list(self.commands)
+
+    def apply(self, query):
+        # Matching commands, the ones that start with the query first
+        query = query.strip().lower()
+        if query == self.query:
+            return self.matches
+
+        candidates = self.indices if query.startswith(self.query) else range(len(self.commands))
+        lowered = self.lowered
+
+        self.indices = [i for i in candidates if query in lowered[i]]
+        self.query = query
+
+        prefixed = [self.commands[i] for i in self.indices if lowered[i].startswith(query)]
+        others = [self.commands[i] for i in self.indices if not lowered[i].startswith(query)]
+        self.matches = prefixed + others
+
+        return self.matches
+
+
+class CommandBrowser(tk.Frame):
+    # Filterable list of commands that only ever holds the rows on screen. The scrollbar and the keys move a window
+    # over the filtered names, so opening, scrolling and filtering cost the same for any number of commands.
+    # on_select(command) is called when a command is chosen, prefetch(commands) with the rows around the window
+    # so their manuals can be loaded before they are asked for
+
+    def __init__(self, master, on_select=None, prefetch=None, rows=12, width=40):
+        super().__init__(master)
+        self.on_select = on_select
+        self.prefetch = prefetch
+        self.rows = rows
+
+        self.filter = CommandFilter()
+        self.matches = []
+        self.top = 0  # index in matches of the first row on screen
+        self.selected = None  # index in matches of the chosen command
+        self.filter_job = None
+        self.prefetch_job = None
+
+        self.filter_entry = tk.Entry(self, width=width)
+        self.filter_entry.pack(fill=tk.X)
+        self.filter_entry.bind("<KeyRelease>", self.schedule_filter)
+        self.filter_entry.bind("<Down>", lambda event: self.move(1))
+        self.filter_entry.bind("<Up>", lambda event: self.move(-1))
+        self.filter_entry.bind("<Return>", lambda event: self.choose())
+
+        list_frame = tk.Frame(self)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.listbox = tk.Listbox(list_frame, height=rows, width=width, exportselection=False, activestyle=tk.NONE)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.listbox.bind("<<ListboxSelect>>", self.clicked)
+        self.listbox.bind("<Down>", lambda event: self.move(1))
+        self.listbox.bind("<Up>", lambda event: self.move(-1))
+        self.listbox.bind("<Next>", lambda event: self.move(self.rows))
+        self.listbox.bind("<Prior>", lambda event: self.move(-self.rows))
+        self.listbox.bind("<Home>", lambda event: self.move(-len(self.matches)))
+        self.listbox.bind("<End>", lambda event: self.move(len(self.matches)))
+        self.listbox.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1))
+
+        self.status_label = tk.Label(self, text="", anchor=tk.W)
+        self.status_label.pack(fill=tk.X)
+
+    def set_commands(self, commands):
+        self.filter.set_commands(commands)
+        self.apply_filter()
+
+    def selected_command(self):
+        return self.matches[self.selected] if self.selected is not None else None
+
+    def schedule_filter(self, event=None):
+        # Restarts the wait on every key, the list is filtered once the typing pauses
+        if event is not None and event.keysym in ("Up", "Down", "Return"):
+            return
+
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(DEBOUNCE_MS, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_job = None
+        command = self.selected_command()
+
+        self.matches = self.filter.apply(self.filter_entry.get())
+        self.top = 0
+        self.selected = None
+
+        # A chosen command that still matches stays chosen, without calling on_select again
+        if command is not None and command in self.matches[:self.rows]:
+            self.selected = self.matches.index(command)
+
+        self.status_label.config(text=f"{len(self.matches)} of {len(self.filter.commands)} commands")
+        self.render()
+
+    def render(self):
+        # Fills the listbox with the rows on screen only
+        self.top = max(0, min(self.top, len(self.matches) - self.rows))
+        window = self.matches[self.top:self.top + self.rows]
+
+        self.listbox.delete(0, tk.END)
+        if window:
+            self.listbox.insert(tk.END, *window)
+
+        if self.selected is not None and self.top <= self.selected < self.top + self.rows:
+            self.listbox.selection_set(self.selected - self.top)
+            self.listbox.activate(self.selected - self.top)
+
+        if self.matches:
+            self.scrollbar.set(self.top / len(self.matches), (self.top + len(window)) / len(self.matches))
+        else:
+            self.scrollbar.set(0, 1)
+
+        self.schedule_prefetch()
+
+    def schedule_prefetch(self):
+        # Once the window is drawn, asks for the rows on screen and one page either side of them
+        if self.prefetch is None:
+            return
+
+        if self.prefetch_job is not None:
+            self.after_cancel(self.prefetch_job)
+        self.prefetch_job = self.after_idle(self.run_prefetch)
+
+    def run_prefetch(self):
+        self.prefetch_job = None
+        start = max(0, self.top - self.rows)
+        self.prefetch(self.matches[start:self.top + 2 * self.rows])
+
+    def yview(self, *args):
+        # Scrollbar command: ('moveto', fraction) or ('scroll', count, 'units' or 'pages')
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.matches))
+        elif args[0] == "scroll":
+            count = int(args[1])
+            self.top += count * self.rows if args[2] == "pages" else count
+        self.render()
+
+    def scroll(self, count):
+        self.top += count * 3
+        self.render()
+        return "break"
+
+    def move(self, count):
+        # Moves the choice and keeps it on screen, the keys act on the whole list and not on the listbox rows
+        if not self.matches:
+            return "break"
+
+        current = self.selected if self.selected is not None else self.top - 1
+        self.selected = max(0, min(current + count, len(self.matches) - 1))
+
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + self.rows:
+            self.top = self.selected - self.rows + 1
+
+        self.render()
+        self.choose()
+        return "break"
+
+    def clicked(self, event=None):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+
+        self.selected = self.top + selection[0]
+        self.choose()
+
+    def choose(self):
+        if self.selected is None and self.matches:
+            self.selected = self.top
+            self.render()
+
+        command = self.selected_command()
+        if command is not None and self.on_select is not None:
+            self.on_select(command)
@@ -0,0 +1,61 @@
+import sys
+import zlib
+
+
+def parse_shard(text):
+    # "i/N" -> (i, N), shards are numbered from 1 to N
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {text!r}, expected i/N such as 2/8")
+
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {text!r}, i must be between 1 and N")
+
+    return index, count
+
+
+def in_shard(command, shard):
+    # The shard only depends on the command name, so every machine agrees whatever the order of its input
+    if shard is None:
+        return True
+
+    index, count = shard
+    return zlib.crc32(command.encode('utf-8')) % count == index - 1
+
+
+def normalize_command(line):
+    # Keeps the command name of an input line, None for blank and comment lines
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return None
+
+    return line.split()[0]
+
+
+def read_lines(source):
+    # Yields the lines of a file, of stdin for '-', or of an already open file
+    if source == '-':
+        yield from sys.stdin
+    elif hasattr(source, 'read'):
+        yield from source
+    else:
+        with open(source, 'r') as file:
+            yield from file
+
+
+def iter_commands(sources, shard=None):
+    # Streams the normalized commands of one or many sources, each command once, in first seen order.
+    # Raises FileNotFoundError for a missing file when the generator reaches it
+    if isinstance(sources, str) or hasattr(sources, 'read'):
+        sources = [sources]
+
+    seen = set()  # only the commands of the shard are remembered
+    for source in sources:
+        for line in read_lines(source):
+            command = normalize_command(line)
+            if command is None or command in seen or not in_shard(command, shard):
+                continue
+
+            seen.add(command)
+            yield command
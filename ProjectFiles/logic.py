@@ -1,23 +1,108 @@
+import asyncio
+import filecmp
+import hashlib
+import json
+import locale
 import os
+import shutil
+import signal
 import subprocess
+import threading
+import time
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from command_input import iter_commands
+from man_page import ManPage
+from manual_record import ManualRecord
+from probe_cache import (COMMAND_RESOLVER, ManPageIndex, bash_version_output, command_identity, file_identity,
+                         whatis_identity)
+from search_index import SearchIndex, SearchIndexBuilder
+from verification import VerificationReport, VerificationResult, compare_manuals
+
+
+# How probe output that is not valid in the locale's encoding is decoded, the same for both ways of probing so
+# they build the same manuals and store the same outputs in the ProbeCache
+OUTPUT_ERRORS = 'replace'
+
+
+def check_output(args, stderr=None, timeout=None):
+    # subprocess.check_output that also kills the children of a probe that timed out, so their open
+    # pipes cannot keep us waiting, and never lets an interactive program wait for input
+    with subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr, text=True,
+                          errors=OUTPUT_ERRORS, start_new_session=True) as process:
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process.pid)
+            process.communicate()
+            raise
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output)
+
+    return output
+
+
+def kill_process_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+XML_TEXT_ENTITIES = {'"': '&quot;'}
+
+# Name of the full-text index, kept in the output folder next to the manuals it indexes
+SEARCH_INDEX_FILE = "manuals_search.idx"
+
+# Bumped whenever a field is built differently, so the manifests written before are no longer current
+MANUAL_FORMAT = "2"
+
+# The probes that run the command itself, pointless when it is a builtin or is missing
+BINARY_PROBES = ('help', 'version', 'short_version')
 
 
 class CommandManualGenerator:
-    def __init__(self, input_file):
-        self.input_file = input_file
+    def __init__(self, input_file, workers=1, timeout=None, cache=None, output_folder="manuals_folder",
+                 incremental=False, backend=None, apropos_index=None, combined_file=None, store=None,
+                 xml_files=True, progress=None, tracer=None, shard=None, search_index_file=None,
+                 snapshot_store=None, environment=None):
+        self.input_file = input_file  # a path, '-' for stdin, or a list of them
+        self.workers = workers
+        self.timeout = timeout  # seconds allowed for each probe of a command
+        self.cache = cache  # optional ProbeCache reused between runs
+        self.output_folder = output_folder
+        self.incremental = incremental  # skip the commands whose probed inputs did not change
+        self.backend = backend  # optional AsyncProbeBackend that runs all the probes up front
+        self.apropos_index = apropos_index  # AproposIndex to reuse, a new one is built for every run otherwise
+        self.combined_file = combined_file  # optional path of one Manuals document with every manual of the run
+        self.store = store  # optional ManualStore that receives every manual
+        self.xml_files = xml_files  # write one XML file per command into the output folder
+        self.progress = progress  # optional callback(done, total, command) called as each command is finished
+        self.tracer = tracer  # optional ProbeTracer that records every probe of the run
+        self.shard = shard  # optional (i, N) from parse_shard, only the commands of shard i of N are generated
+        self.search_index_file = search_index_file  # optional path of the full-text index of the input's manuals
+        self.snapshot_store = snapshot_store  # optional SnapshotStore that records the manuals of every run
+        self.environment = environment  # environment tag of the snapshots, environment_tag() of this host by default
+        self.snapshot = None  # id of the snapshot recorded by the last run
+        self.errors = {}  # command -> error message of the last generate_manuals run
+        self.skipped = []  # commands left untouched by the last incremental run
+        self.cancelled = False
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def iter_commands(self):
+        # Streams the commands of the input, without blank lines and duplicates, raises FileNotFoundError
+        return iter_commands(self.input_file, self.shard)
 
     def read_commands_from_file(self):
-        commands = []
         try:
-            with open(self.input_file, 'r') as file:
-                for line in file:
-                    commands.append(line.strip())
-        except FileNotFoundError:
-            return f"File not found: {self.input_file}"
-
-        return commands
+            return list(self.iter_commands())
+        except FileNotFoundError as error:
+            return f"File not found: {error.filename}"
 
     def generate_manuals(self):
 
@@ -26,20 +111,522 @@ class CommandManualGenerator:
         if type(commands) is str:
             return commands
 
-        for command in commands:
-            manual = CommandManual(command)
-            manual_data = manual.generate_manual()
+        self.errors = {}
+        self.skipped = []
+        self.done = 0
+        total = len(commands)
+
+        def report(command):
+            self.report_progress(command, total)
+
+        # The manifest is always kept up to date, the fast verification relies on it
+        man_index = self.cache.man_index if self.cache is not None else None
+        manifest = ManualManifest(self.output_folder, man_index)
+        pending = commands
+
+        if self.incremental:
+            pending = []
+            for command in commands:
+                if manifest.is_current(command) and self.manual_exists(command):
+                    self.skipped.append(command)
+                    report(command)
+                else:
+                    pending.append(command)
+
+        # One 'man -k .' dump answers the related commands of the whole run
+        apropos_index = self.apropos_index if self.apropos_index is not None else \
+            AproposIndex(self.timeout, self.cache)
+        probes = [CommandProbe(command, self.timeout, self.cache, apropos_index, self.tracer) for command in pending]
+
+        if self.backend is not None:
+            if self.cancelled:
+                self.errors.update((probe.command, "Cancelled") for probe in probes)
+            else:
+                self.errors.update(self.backend.run(probes, report))
+
+            # Every probe already has its output, building the manuals does not wait on anything
+            probes = [probe for probe in probes if probe.command not in self.errors]
+            manuals = [self.generate_command_manual(probe) for probe in probes]
 
-            xml_serializer = XmlSerializer(manual_data)
-            xml_serializer.create_xml()
+        else:
+            def build(probe):
+                if self.cancelled:
+                    self.errors[probe.command] = "Cancelled"
+                    return None
+
+                manual_data = self.generate_command_manual(probe)
+                report(probe.command)
+                return manual_data
+
+            if self.workers > 1:
+                # The probes are subprocess bound, so threads are enough to overlap them
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    manuals = list(executor.map(build, probes))
+            else:
+                manuals = [build(probe) for probe in probes]
+
+        # Write the manuals in input order so the output is the same for any worker count
+        for manual_data in manuals:
+            if manual_data is not None:
+                if self.xml_files:
+                    xml_serializer = XmlSerializer(manual_data, self.output_folder)
+                    xml_serializer.create_xml()
+
+                manifest.update(manual_data['CommandName'])
+
+        if self.store is not None:
+            self.store.put_many(manual_data for manual_data in manuals if manual_data is not None)
+
+        manifest.save()
+
+        if self.combined_file is not None or self.search_index_file is not None or self.snapshot_store is not None:
+            # The manuals an incremental run skipped are read back, so these files always cover the whole input
+            input_manuals = self.input_manuals(commands, manuals)
+
+            if self.combined_file is not None:
+                XmlSerializer.create_combined_xml(input_manuals, self.combined_file)
+
+            if self.search_index_file is not None:
+                self.write_search_index(input_manuals)
+
+            # A cancelled run would look like commands vanished from the host
+            if self.snapshot_store is not None and not self.cancelled:
+                self.snapshot = self.snapshot_store.record_snapshot(input_manuals, self.environment)
+
+        if self.tracer is not None:
+            self.tracer.end_run()
 
         return commands
 
+    def input_manuals(self, commands, manuals):
+        # The manual of every command of the input, the ones this run did not build are read back
+        built = {manual_data['CommandName']: manual_data for manual_data in manuals if manual_data is not None}
+        input_manuals = []
+
+        for command in commands:
+            manual_data = built.get(command) or self.load_manual(command)
+            if manual_data:
+                input_manuals.append(manual_data)
+
+        return input_manuals
+
+    def write_search_index(self, input_manuals):
+        write_search_index(input_manuals, self.search_index_file)
+
+    def load_manual(self, command):
+        if self.store is not None:
+            return self.store.get(command)
+
+        try:
+            return read_manual_file(XmlSerializer.manual_path(self.output_folder, command))
+        except (FileNotFoundError, ET.ParseError):
+            return None
+
+    def cancel(self):
+        # Can be called from any thread, the commands not probed yet are skipped and reported as cancelled
+        self.cancelled = True
+        if self.backend is not None:
+            self.backend.cancel()
+
+    def report_progress(self, command, total):
+        with self.lock:
+            self.done += 1
+            done = self.done
+
+        if self.progress is not None:
+            self.progress(done, total, command)
+
+    def manual_exists(self, command):
+        if self.store is not None and not self.store.contains(command):
+            return False
+
+        return not self.xml_files or os.path.exists(XmlSerializer.manual_path(self.output_folder, command))
+
+    def generate_command_manual(self, probe):
+        try:
+            manual = CommandManual(probe.command, self.timeout, probe)
+            return manual.generate_manual()
+
+        except Exception as error:
+            # Record the failure and keep going, one bad command must not abort the batch
+            self.errors[probe.command] = f"{type(error).__name__}: {error}"
+            return None
+
+
+class CommandProbe:
+    # Runs each probe of a command at most once and shares the output between all the get_* methods
+
+    def __init__(self, command, timeout=None, cache=None, apropos_index=None, tracer=None, resolver=None):
+        self.command = command
+        self.timeout = timeout
+        self.cache = cache  # optional ProbeCache shared between runs
+        self.apropos_index = apropos_index  # optional AproposIndex shared by all the commands of a run
+        self.tracer = tracer  # optional ProbeTracer, nothing is timed without one
+        self.resolver = resolver if resolver is not None else COMMAND_RESOLVER
+        self.identity = None  # binary and man page identity, computed once when the cache is used
+        self.outputs = {}  # probe name -> output, or None if the probe exited with an error
+        self.page = None  # ManPage of the man output, parsed on first use
+
+    def arguments(self, name):
+        # Command line of every probe, and whether its stderr is discarded
+        if name == 'man':
+            return ['man', self.command], subprocess.DEVNULL
+        elif name == 'help':
+            return [self.command, '--help'], None
+        elif name == 'version':
+            return [self.command, '--version'], subprocess.DEVNULL
+        elif name == 'short_version':
+            return [self.command, '-v'], subprocess.DEVNULL
+        elif name == 'apropos':
+            return ['man', '-k', self.command], None
+        else:
+            raise ValueError(f"Unknown probe: {name}")
+
+    def cache_key(self, name):
+        if self.identity is None:
+            self.identity = self.cache.identity(self.command)
+
+        return self.cache.make_key(self.command, name, self.identity)
+
+    def lookup(self, name):
+        # Returns (found, output) from the probes already run, then from the cache
+        if name in self.outputs:
+            return True, self.outputs[name]
+
+        if name in BINARY_PROBES:
+            started = time.perf_counter()
+            kind = self.resolver.resolve(self.command)
+            if kind != 'binary':
+                # Known to fail without forking anything
+                self.outputs[name] = None
+                if self.tracer is not None:
+                    self.tracer.probe(self.command, name, started, kind, None, 'resolver')
+                return True, None
+
+        if self.cache is not None:
+            started = time.perf_counter()
+            found, output = self.cache.get(self.cache_key(name))
+            if found:
+                self.outputs[name] = output
+                if self.tracer is not None:
+                    self.tracer.probe(self.command, name, started, None, output, 'cache')
+                return True, output
+
+        return False, None
+
+    def store(self, name, output):
+        self.outputs[name] = output
+
+        if self.cache is not None:
+            self.cache.put(self.cache_key(name), output)
+
+    def run(self, name):
+        found, output = self.lookup(name)
+        if found:
+            return output
+
+        args, stderr = self.arguments(name)
+        started = time.perf_counter()
+        status = 0
+        try:
+            output = check_output(args, stderr=stderr, timeout=self.timeout)
+        except subprocess.CalledProcessError as error:
+            output = None
+            status = error.returncode
+        except FileNotFoundError:
+            output = None
+            status = self.missing(name)
+        except Exception as error:
+            if self.tracer is not None:
+                self.tracer.probe(self.command, name, started, type(error).__name__, None, 'run')
+            raise
+
+        if self.tracer is not None:
+            self.tracer.probe(self.command, name, started, status, output, 'run')
+
+        self.store(name, output)
+
+        return output
+
+    def missing(self, name):
+        # The program of the probe does not exist, returns the exit status recorded for the probe
+        if name in BINARY_PROBES:
+            # The binary went away after it was resolved
+            self.resolver.mark_missing(self.command)
+
+        return 'missing'
+
+    def man_output(self):
+        return self.run('man')
+
+    def help_output(self):
+        return self.run('help')
+
+    def version_output(self):
+        return self.run('version')
+
+    def short_version_output(self):
+        return self.run('short_version')
+
+    def apropos_output(self):
+        return self.run('apropos')
+
+    def related_commands(self):
+        # Names printed by 'man -k <command>', answered by the shared index when it could be built
+        if self.apropos_index is not None:
+            started = time.perf_counter()
+            names = self.apropos_index.lookup(self.command)
+            if names is not None:
+                if self.tracer is not None:
+                    self.tracer.probe(self.command, 'apropos', started, None, '\n'.join(names), 'index')
+                return names
+
+        man_output = self.apropos_output()
+        if man_output is None:
+            return None
+
+        command_names = []
+        for line in man_output.split('\n'):
+            if line.strip():
+                command_names.append(line.split()[0])
+
+        return command_names
+
+    def man_page(self):
+        # The parsed man page, None when the command has none
+        if self.page is None:
+            man_output = self.man_output()
+            if man_output is None:
+                return None
+
+            self.page = ManPage(man_output)
+
+        return self.page
+
+
+class AproposIndex:
+    # Answers 'man -k <command>' for every command from a single 'man -k .' dump of the whatis database
+
+    def __init__(self, timeout=None, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.available = False  # False when the dump failed, the commands then run 'man -k' themselves
+        self.names = []  # entry names in the order apropos prints them
+        self.texts = []  # lowercase name and description of each entry, what apropos matches against
+        self.postings = {}  # two-character substring -> ids of the entries that contain it, ascending
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+
+            key = None
+            found = False
+            identity = whatis_identity()
+            # Without a known whatis database nothing tells when the dump is stale, so it is not cached
+            if self.cache is not None and identity != "-":
+                key = self.cache.make_key('', 'apropos_index', identity)
+                found, output = self.cache.get(key)
+
+            if not found:
+                try:
+                    output = check_output(['man', '-k', '.'], stderr=subprocess.DEVNULL, timeout=self.timeout)
+                except (subprocess.CalledProcessError, OSError):
+                    output = None
+
+                if key is not None:
+                    self.cache.put(key, output)
+
+            if output is not None:
+                self.build(output)
+                self.available = True
+
+            self.loaded = True
+
+    def build(self, output):
+        for line in output.split('\n'):
+            if not line.strip():
+                continue
+
+            name = line.split()[0]
+            description = line.partition(' - ')[2]
+            text = f"{name}\n{description}".lower()
+
+            entry_id = len(self.names)
+            self.names.append(name)
+            self.texts.append(text)
+
+            for gram in set(text[i:i + 2] for i in range(len(text) - 1)):
+                self.postings.setdefault(gram, []).append(entry_id)
+
+    def lookup(self, command, limit=5):
+        # Returns the first entries that mention the command, or None if the index could not be built
+        self.load()
+        if not self.available:
+            return None
+
+        keyword = command.lower()
+        if len(keyword) < 2:
+            candidates = range(len(self.names))
+        else:
+            # Only the entries that contain the rarest pair of characters of the command can match
+            grams = set(keyword[i:i + 2] for i in range(len(keyword) - 1))
+            candidates = min((self.postings.get(gram, []) for gram in grams), key=len)
+
+        names = []
+        for entry_id in candidates:
+            if keyword in self.texts[entry_id]:
+                names.append(self.names[entry_id])
+                if len(names) == limit:
+                    break
+
+        return names
+
+
+class AsyncProbeBackend:
+    # Runs the probes of many commands concurrently with asyncio, so the wall time follows the slowest probe
+
+    def __init__(self, concurrency=16, timeout=None):
+        self.concurrency = concurrency  # subprocesses allowed to run at the same time
+        self.timeout = timeout  # seconds allowed for each probe
+        self.loop = None
+        self.main_task = None
+        self.cancelled = False
+
+    def run(self, probes, progress=None):
+        # Fills the outputs of the given CommandProbes, returns command -> error for the commands that failed.
+        # progress(command) is called as soon as every probe of a command has finished
+        self.cancelled = False
+
+        # Build the shared apropos indexes before the event loop starts, the dump is a single blocking call
+        for probe in probes:
+            if probe.apropos_index is not None:
+                probe.apropos_index.load()
+
+        return asyncio.run(self.probe_all(probes, progress))
+
+    def cancel(self):
+        # Can be called from any thread, the running and pending probes are stopped
+        self.cancelled = True
+        if self.loop is not None and self.main_task is not None:
+            self.loop.call_soon_threadsafe(self.main_task.cancel)
+
+    async def probe_all(self, probes, progress=None):
+        self.loop = asyncio.get_running_loop()
+        self.main_task = asyncio.current_task()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        tasks = []
+        for probe in probes:
+            task = asyncio.ensure_future(self.probe_command(probe, semaphore))
+            if progress is not None:
+                task.add_done_callback(lambda done, command=probe.command: done.cancelled() or progress(command))
+            tasks.append(task)
+
+        errors = {}
+        try:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        except asyncio.CancelledError:
+            # Cancel the stragglers and wait for their processes to be killed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        finally:
+            self.loop = None
+            self.main_task = None
+
+        for probe, task in zip(probes, tasks):
+            if task.cancelled():
+                errors[probe.command] = "Cancelled"
+            elif task.exception() is not None:
+                error = task.exception()
+                errors[probe.command] = f"{type(error).__name__}: {error}"
+
+        return errors
+
+    async def probe_command(self, probe, semaphore):
+        # Follows the same fallbacks as CommandManual, independent chains run concurrently
+        async def fetch(name):
+            found, output = probe.lookup(name)
+            if found:
+                return output
+
+            args, stderr = probe.arguments(name)
+            started = time.perf_counter()
+            try:
+                status, output = await self.execute(args, stderr, semaphore)
+            except FileNotFoundError:
+                status, output = probe.missing(name), None
+            except Exception as error:
+                if probe.tracer is not None:
+                    probe.tracer.probe(probe.command, name, started, type(error).__name__, None, 'run')
+                raise
+
+            if probe.tracer is not None:
+                probe.tracer.probe(probe.command, name, started, status, output, 'run')
+
+            probe.store(name, output)
+
+            return output
+
+        async def description():
+            if await fetch('man') is None:
+                await fetch('help')
+
+        async def version():
+            if await fetch('version') is None:
+                await fetch('short_version')
+
+        chains = [description(), version()]
+        if probe.apropos_index is None or not probe.apropos_index.available:
+            chains.append(fetch('apropos'))
+
+        # Let every chain finish, each probe is bounded by the timeout anyway, then fail on the first error
+        results = await asyncio.gather(*chains, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def execute(self, args, stderr, semaphore):
+        # Returns (exit status, output), output is None when the probe exited with an error
+        async with semaphore:
+            process = await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE, stderr=stderr,
+                                                           start_new_session=True)
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(), self.timeout)
+
+            except asyncio.TimeoutError:
+                kill_process_group(process.pid)
+                await process.wait()
+                raise subprocess.TimeoutExpired(args, self.timeout)
+
+            except asyncio.CancelledError:
+                kill_process_group(process.pid)
+                await process.wait()
+                raise
+
+        if process.returncode != 0:
+            return process.returncode, None
+
+        # Decode like subprocess.check_output(text=True) does
+        output = stdout.decode(locale.getpreferredencoding(False), errors=OUTPUT_ERRORS)
+        return 0, output.replace('\r\n', '\n').replace('\r', '\n')
+
 
 class CommandManual:
 
-    def __init__(self, command):
+    def __init__(self, command, timeout=None, probe=None, cache=None):
         self.command = command
+        self.timeout = timeout
+        self.probe = probe if probe is not None else CommandProbe(command, timeout, cache)
+        self.tracer = self.probe.tracer
 
     def generate_manual(self):
         description = self.get_command_description()
@@ -49,72 +636,83 @@ class CommandManual:
         online_documentation_links = self.get_online_documentation_links()
         recommended_commands = self.get_recommended_commands()
 
+        return ManualRecord(self.command, description, version_history, examples, related_commands,
+                            online_documentation_links, recommended_commands)
+
+    def generate_static_fields(self):
+        # The fields that come from the tables of this file, they never need a probe
         return {
             'CommandName': self.command,
-            'CommandDescription': description,
-            'VersionHistory': version_history,
-            'Example': examples,
-            'RelatedCommands': related_commands,
-            'OnlineDocumentationLinks': online_documentation_links,
-            'RecommendedCommands': recommended_commands
+            'Example': self.get_examples(),
+            'OnlineDocumentationLinks': self.get_online_documentation_links(),
+            'RecommendedCommands': self.get_recommended_commands()
         }
 
     def get_command_description(self):
-        try:
-            # Try getting description from man page
-            man_output = subprocess.check_output(['man', self.command], stderr=subprocess.DEVNULL, text=True)
-
-            description = ''
-            start_description = False  # flag if "DESCRIPTION" found
+        started = time.perf_counter()
 
-            for line in man_output.split('\n'):
+        # Try getting description from man page
+        if self.probe.man_output() is not None:
+            path = ['man']
+            description = self.probe.man_page().description() or ''
 
-                if start_description:
-                    if not line.strip():
-                        break  # Stop when an empty line is encountered
-                    description += line + '\n'
-
-                elif line.strip() == 'DESCRIPTION':
-                    start_description = True
-
-        except subprocess.CalledProcessError:
-            try:
-                # Try getting description from --help option
-                help_output = subprocess.check_output([self.command, '--help'], text=True)
+        # Try getting description from --help option
+        elif self.probe.help_output() is not None:
+            path = ['man', 'help']
+            description = self.probe.help_output().split('\n')[1]
 
-                description = help_output.split('\n')[1]
+        else:
+            path = ['man', 'help', 'none']
+            description = f"There is no description for {self.command}"
 
-            except subprocess.CalledProcessError:
-                description = f"There is no description for {self.command}"
+        self.trace_field('CommandDescription', started, path)
 
         return description.strip()
 
     def get_version_history(self):
-        try:
-            # Try getting version from --version option
-            version_output = subprocess.check_output([self.command, '--version'], stderr=subprocess.DEVNULL, text=True)
+        started = time.perf_counter()
+        path = ['version']
+
+        # Try getting version from --version option, then from -v option
+        version_output = self.probe.version_output()
+        if version_output is None:
+            path.append('short_version')
+            version_output = self.probe.short_version_output()
+
+        if version_output is not None:
             version = version_output.split('\n')[0].split(' ', 1)[1]
 
-        except subprocess.CalledProcessError:
-            try:
-                # Try getting version from -v option
-                version_output = subprocess.check_output([self.command, '-v'], stderr=subprocess.DEVNULL, text=True)
-                version = version_output.split('\n')[0].split(' ', 1)[1]
+        else:
+            # Try getting version from man page
+            path.append('man')
+            man_page = self.probe.man_page()
+            man_version = man_page.version() if man_page is not None else None
 
-            except subprocess.CalledProcessError:
-                try:
-                    # Try getting version from man page
-                    man_output = subprocess.check_output(['man', self.command], stderr=subprocess.DEVNULL, text=True)
-                    version_line = next(line for line in man_output.split('\n') if line.startswith('Version'))
-                    version = version_line.split(' ', 1)[1]
+            if man_version is not None:
+                version = man_version
+
+            else:
+                # If all else fails, use the BASH version, it is only asked once per process
+                path.append('bash')
+                bash_started = time.perf_counter()
+                bash_output = bash_version_output()
+                if self.tracer is not None:
+                    self.tracer.probe(self.command, 'bash', bash_started, None, bash_output, 'memo')
+
+                if bash_output is not None:
+                    version = "As the BASH version: " + bash_output.split(' ', 4)[3].split('\n')[0]
+                else:
+                    version = f"There is no version for {self.command}"
 
-                except (subprocess.CalledProcessError, StopIteration):
-                    # If all else fails, use the BASH version
-                    version = "As the BASH version: " + \
-                              subprocess.check_output(['bash', '--version'], text=True).split(' ', 4)[3].split('\n')[0]
+        self.trace_field('VersionHistory', started, path)
 
         return version.strip()
 
+    def trace_field(self, field, started, path):
+        # path is the chain of probes the field fell back through, the last one gave its value
+        if self.tracer is not None:
+            self.tracer.field(self.command, field, started, path)
+
     def get_examples(self):
         examples = {
             "wc": "wc -l filename.txt",
@@ -142,22 +740,16 @@ class CommandManual:
         return examples.get(self.command, f"No example available for {self.command}")
 
     def get_related_commands(self):
-        try:
-            # Run the 'man -k' command and capture the output
-            man_output = subprocess.check_output(['man', '-k', self.command], text=True)
-
-            command_names = []
-            for line in man_output.split('\n'):
-                if line.strip():
-                    command_names.append(line.split()[0])
+        # Use the commands listed by 'man -k'
+        command_names = self.probe.related_commands()
 
-            # Join the related commands with tabs
-            related_commands = '\t'.join(command_names[:5])
+        if not command_names:
+            return f"No related commands found for {self.command}"
 
-            return related_commands
+        # Join the related commands with tabs
+        related_commands = '\t'.join(command_names[:5])
 
-        except subprocess.CalledProcessError:
-            return f"No related commands found for {self.command}"
+        return related_commands
 
     def get_online_documentation_links(self):
 
@@ -197,160 +789,472 @@ class CommandManual:
         return recommend
 
 
+class ManualManifest:
+    # Fingerprint of the probed inputs of every manual in the output folder, used to skip unchanged commands
+
+    def __init__(self, output_folder, man_index=None):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, "manifest.json")
+        self.man_index = man_index if man_index is not None else ManPageIndex()
+        self.current = {}  # command -> fingerprint computed during this run
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as manifest_file:
+                self.fingerprints = json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            self.fingerprints = {}
+
+    def fingerprint(self, command):
+        if command not in self.current:
+            # The binary and man page identity covers the probes, the static tables are hashed as they are
+            manual = CommandManual(command)
+            inputs = [MANUAL_FORMAT, command, command_identity(command, self.man_index), manual.get_examples(),
+                      manual.get_online_documentation_links(), manual.get_recommended_commands()]
+
+            self.current[command] = hashlib.sha256("\0".join(inputs).encode('utf-8')).hexdigest()
+
+        return self.current[command]
+
+    def is_current(self, command):
+        return self.fingerprints.get(command) == self.fingerprint(command)
+
+    def update(self, command):
+        self.fingerprints[command] = self.fingerprint(command)
+
+    def save(self):
+        if not os.path.exists(self.output_folder):
+            os.makedirs(self.output_folder)
+
+        # Write to a temporary file first so an interrupted run never leaves a broken manifest
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(self.fingerprints, manifest_file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
 class XmlSerializer:
-    def __init__(self, manual_data):
+    def __init__(self, manual_data, output_folder="manuals_folder"):
         self.manual_data = manual_data
-        self.output_folder = "manuals_folder"
+        self.output_folder = output_folder
+
+    @staticmethod
+    def manual_path(output_folder, command):
+        return os.path.join(output_folder, f"{command}_manual.xml")
 
     def create_xml(self):
         # Create the output folder if it doesn't exist
         if not os.path.exists(self.output_folder):
             os.makedirs(self.output_folder)
 
-        manuals = ET.Element("Manuals")
+        file_path = self.manual_path(self.output_folder, self.manual_data['CommandName'])
+
+        return self.write_document(file_path, [self.manual_data])
 
-        command_manual = ET.Element("CommandManual")
-        for key, value in self.manual_data.items():
-            element = ET.SubElement(command_manual, key)
-            element.text = value
+    @classmethod
+    def create_combined_xml(cls, manuals, file_path):
+        # Write many manuals into a single Manuals document, manuals can be any iterable of manual data
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
 
-        manuals.append(command_manual)
+        return cls.write_document(file_path, manuals)
 
-        # Save the XML structure to a file with indentation
-        file_path = os.path.join(self.output_folder, f"{self.manual_data['CommandName']}_manual.xml")
+    @classmethod
+    def write_document(cls, file_path, manuals):
+        # Stream the document into a temporary file next to the target, then swap it in atomically
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
 
-        xml_str = ET.tostring(manuals, encoding='utf-8').decode()
-        xml_str_pretty = minidom.parseString(xml_str).toprettyxml(indent="  ")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as xml_file:
+                xml_file.write('<?xml version="1.0" ?>\n<Manuals>\n')
+                for manual_data in manuals:
+                    cls.write_manual(xml_file, manual_data)
+                xml_file.write('</Manuals>\n')
+
+            # Leave the file untouched when its content did not change
+            if os.path.exists(file_path) and filecmp.cmp(temp_path, file_path, shallow=False):
+                os.remove(temp_path)
+                return False
+
+            os.replace(temp_path, file_path)
+
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return True
+
+    @staticmethod
+    def write_manual(xml_file, manual_data):
+        # Same layout and escaping as minidom's toprettyxml(indent="  "), so existing files stay byte for byte
+        xml_file.write('  <CommandManual>\n')
 
-        with open(file_path, 'w', encoding='utf-8') as xml_file:
-            xml_file.write(xml_str_pretty)
+        for key, value in manual_data.items():
+            if value:
+                xml_file.write(f'    <{key}>{escape(value, XML_TEXT_ENTITIES)}</{key}>\n')
+            else:
+                xml_file.write(f'    <{key}/>\n')
+
+        xml_file.write('  </CommandManual>\n')
 
 
 class ManualVerifier:
-    def __init__(self, existing_content_path, input_file):
+    def __init__(self, existing_content_path, input_file, timeout=None, cache=None, backend=None,
+                 apropos_index=None, store=None, workers=1, fast=False, max_mismatches=None, progress=None,
+                 tracer=None):
         self.existing_content_path = existing_content_path
         self.input_file = input_file
+        self.timeout = timeout
+        self.cache = cache
+        self.backend = backend  # optional AsyncProbeBackend that runs all the probes up front
+        self.apropos_index = apropos_index  # AproposIndex to reuse, a new one is built for every run otherwise
+        self.store = store  # optional ManualStore read instead of the XML files
+        self.workers = workers  # threads verifying commands at the same time
+        self.fast = fast  # trust the fingerprints of the manifest and only probe the commands that changed
+        self.max_mismatches = max_mismatches  # stop after this many manuals failed the verification
+        self.progress = progress  # optional callback(done, total, command) called as each command is finished
+        self.tracer = tracer  # optional ProbeTracer that records every probe of the run
+        self.cancelled = False
+        self.done = 0
+        self.lock = threading.Lock()
 
     def verify_manuals(self, commands):
-        verification_messages = []
+        # One message per command, see verify for the structured results
+        return self.verify(commands).messages()
+
+    def verify(self, commands):
+        # VerificationReport with a VerificationResult per verified command
+        verification_report = VerificationReport()
 
-        if not os.path.exists(self.existing_content_path):
-            verification_messages.append("manuals are not generated *_*")
+        if self.store is not None:
+            generated = len(self.store.commands()) != 0
         else:
+            generated = os.path.exists(self.existing_content_path)
 
-            for command in commands:
-                generator = CommandManual(command)
-                existing_content = self.read_existing_content(command)
+        if not generated:
+            verification_report.error = "manuals are not generated *_*"
+        else:
+            manifest = None
+            if self.fast:
+                man_index = self.cache.man_index if self.cache is not None else None
+                manifest = ManualManifest(self.existing_content_path, man_index)
+
+            # One 'man -k .' dump answers the related commands of the whole run
+            apropos_index = self.apropos_index if self.apropos_index is not None else \
+                AproposIndex(self.timeout, self.cache)
+            probes = {command: CommandProbe(command, self.timeout, self.cache, apropos_index, self.tracer)
+                      for command in commands}
+
+            self.done = 0
+            total = len(commands)
+
+            def report(command):
+                self.report_progress(command, total)
+
+            errors = {}
+            probed = set()
+
+            def verify(command):
+                result = self.verify_command(command, probes[command], errors, manifest)
+
+                # The commands probed by the backend were already counted when their probes finished
+                if command not in probed:
+                    report(command)
+
+                return result
+
+            mismatches = 0
+            for chunk in self.backend_chunks(commands):
+                if self.backend is not None:
+                    # In fast mode the commands whose fingerprint did not change are never probed
+                    changed = [probes[command] for command in chunk
+                               if manifest is None or not manifest.is_current(command)]
+                    probed.update(probe.command for probe in changed)
+
+                    if self.cancelled:
+                        errors.update((probe.command, "Cancelled") for probe in changed)
+                    else:
+                        errors.update(self.backend.run(changed, report))
+
+                for result in self.map_commands(verify, chunk):
+                    verification_report.add(result)
+
+                    if not result.ok:
+                        mismatches += 1
+                        if self.max_mismatches is not None and mismatches >= self.max_mismatches:
+                            break
+
+                if self.max_mismatches is not None and mismatches >= self.max_mismatches:
+                    break
+
+            if self.tracer is not None:
+                self.tracer.end_run()
+
+        return verification_report
+
+    def backend_chunks(self, commands):
+        # The backend probes a whole chunk before any of it is verified. With max_mismatches the chunks are as
+        # small as the backend's concurrency, so stopping early leaves the following chunks unprobed
+        if self.backend is None or self.max_mismatches is None:
+            return [commands]
+
+        size = max(self.backend.concurrency, 1)
+        return [commands[start:start + size] for start in range(0, len(commands), size)]
+
+    def cancel(self):
+        # Can be called from any thread, the commands not verified yet are skipped
+        self.cancelled = True
+        if self.backend is not None:
+            self.backend.cancel()
+
+    def report_progress(self, command, total):
+        with self.lock:
+            self.done += 1
+            done = self.done
+
+        if self.progress is not None:
+            self.progress(done, total, command)
+
+    def verify_command(self, command, probe, errors, manifest):
+        if command in errors:
+            return VerificationResult.failure(command, errors[command])
+
+        try:
+            generator = CommandManual(command, self.timeout, probe)
+            existing_content = self.read_existing_content(command)
+            if not isinstance(existing_content, ManualRecord):
+                # No manual to compare with, probing the command would be wasted
+                return VerificationResult.failure(command, existing_content)
+
+            if manifest is not None and manifest.is_current(command):
+                # Nothing the probes read has changed, only the fields that need no probe are generated again
+                generated_content = existing_content.replace(**generator.generate_static_fields())
+            else:
                 generated_content = generator.generate_manual()
 
-                verification_message = self.compare_content(existing_content, generated_content)
+        except Exception as error:
+            return VerificationResult.failure(command, f"{type(error).__name__}: {error}")
+
+        return compare_manuals(existing_content, generated_content)
+
+    def map_commands(self, function, commands):
+        # Yields function(command) in input order, using the worker threads when there are more than one
+        if self.workers <= 1:
+            for command in commands:
+                if self.cancelled:
+                    return
+                yield function(command)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+
+        try:
+            for command in commands:
+                if self.cancelled:
+                    break
+                pending.append(executor.submit(function, command))
 
-                if verification_message is not None:  # Check if verification_message is not None
-                    verification_messages.append(verification_message)
+                # Only a few commands are queued ahead, so stopping early leaves the rest unprobed
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
 
-        return verification_messages
+            while pending:
+                yield pending.popleft().result()
+
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
     def read_existing_content(self, command):
+        if self.store is not None:
+            command_data = self.store.get(command)
+            if command_data is None:
+                command_data = f"{command} not found in {self.store.path}"
+
+            return command_data
+
         existing_file_path = os.path.join(self.existing_content_path, f"{command}_manual.xml")
 
         try:
-            # Load the XML file
-            tree = ET.parse(existing_file_path)
-            root = tree.getroot()
-
-            command_data = {}
-            # Iterate through each 'CommandManual' element
-            for command_manual_elem in root.findall('CommandManual'):
-                # Extract information
-                command_data = {
-                    'CommandName': command_manual_elem.find('CommandName').text,
-                    'CommandDescription': command_manual_elem.find('CommandDescription').text,
-                    'VersionHistory': command_manual_elem.find('VersionHistory').text,
-                    'Example': command_manual_elem.find('Example').text,
-                    'RelatedCommands': command_manual_elem.find('RelatedCommands').text,
-                    'OnlineDocumentationLinks': command_manual_elem.find('OnlineDocumentationLinks').text,
-                    'RecommendedCommands': command_manual_elem.find('RecommendedCommands').text
-                }
+            command_data = read_manual_file(existing_file_path)
         except FileNotFoundError:
             command_data = f"{existing_file_path} not found"
 
+        if command_data is None:
+            command_data = f"{existing_file_path} has no manual"
+
         return command_data
 
     @staticmethod
     def compare_content(existing_content, generated_content):
-
-        if type(existing_content) is not dict:
+        # Message of the comparison of two manuals, existing_content is returned as is when it is an error message.
+        # The manuals can be ManualRecords or dicts of their fields
+        if isinstance(existing_content, dict):
+            existing_content = ManualRecord.from_dict(existing_content)
+        if isinstance(generated_content, dict):
+            generated_content = ManualRecord.from_dict(generated_content)
+
+        if not isinstance(existing_content, ManualRecord):
             return existing_content
 
-        verification_message = f"\n{existing_content['CommandName']}: "
-        error = False
-        for key in existing_content.keys():
-            existing_value = existing_content.get(key)
-            generated_value = generated_content.get(key)
+        return compare_manuals(existing_content, generated_content).message()
 
-            if existing_value != generated_value:
-                error = True
-                verification_message += f"{key}: Content has changed\n\n" \
-                                        f"  Existing Content: {existing_value}\n\n" \
-                                        f"  Generated Content: {generated_value}\n\n"
 
-        if not error:
-            verification_message += "verified successfully"
+def search_index_path(output_folder="manuals_folder"):
+    return os.path.join(output_folder, SEARCH_INDEX_FILE)
 
-        return verification_message
 
+def write_search_index(manuals, index_file):
+    builder = SearchIndexBuilder()
+    for manual_data in manuals:
+        builder.add(manual_data)
 
-def get_info_for_selection(command, selection):
+    builder.write(index_file)
 
-    file_path = f"manuals_folder/{command}_manual.xml"
 
-    try:
-        # Load the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-
-        command_data = {}
-        # Iterate through each 'CommandManual' element
-        for command_manual_elem in root.findall('CommandManual'):
-            # Extract information
-            command_data = {
-                    'CommandName': command_manual_elem.find('CommandName').text,
-                    'CommandDescription': command_manual_elem.find('CommandDescription').text,
-                    'VersionHistory': command_manual_elem.find('VersionHistory').text,
-                    'Example': command_manual_elem.find('Example').text,
-                    'RelatedCommands': command_manual_elem.find('RelatedCommands').text,
-                    'OnlineDocumentationLinks': command_manual_elem.find('OnlineDocumentationLinks').text,
-                    'RecommendedCommands': command_manual_elem.find('RecommendedCommands').text
-                }
-
-        if selection == "Show All Info":
-            keys_to_extract = ['CommandDescription', 'VersionHistory', 'Example', 'RelatedCommands', 'OnlineDocumentationLinks', 'RecommendedCommands']
-            formatted_output = ""
-            for key in keys_to_extract:
-                formatted_output += f"{key}: {command_data[key]}\n\n"
-
-            return formatted_output
-
-        elif selection == "Show Description":
-            return f"Command Description: {command_data['CommandDescription']}"
-
-        elif selection == "Show Version":
-            return f"Command Version: {command_data['VersionHistory']}"
-
-        elif selection == "Show Example":
-            return f"Command Example: {command_data['Example']}"
-
-        elif selection == "Show Related Commands":
-            return f"Command Related Commands: {command_data['RelatedCommands']}"
-
-        elif selection == "Show Online Documentation Links":
-            return f"Command Online Documentation Links: {command_data['OnlineDocumentationLinks']}"
-
-        elif selection == "Show Recommended Commands":
-            return f"Command Recommended Commands: {command_data['RecommendedCommands']}"
+def merge_output_folders(shard_folders, output_folder, store=None):
+    # Gathers the manuals and the manifests generated by the shards of a catalogue into one output folder,
+    # then indexes every merged manual, as the index of each shard only knows that shard's commands
+    manifest = ManualManifest(output_folder)
+    merged = set()  # a command found in several folders counts once
 
-        else:
-            return f"Invalid selection: {selection}"
+    for folder in shard_folders:
+        shard_manifest = ManualManifest(folder)
+
+        for command, fingerprint in shard_manifest.fingerprints.items():
+            manual_path = XmlSerializer.manual_path(folder, command)
+            if os.path.exists(manual_path):
+                if not os.path.exists(output_folder):
+                    os.makedirs(output_folder)
+                shutil.copyfile(manual_path, XmlSerializer.manual_path(output_folder, command))
+            elif store is None or not store.contains(command):
+                # A fingerprint without a manual would make an incremental run skip a command that has none
+                continue
+
+            manifest.fingerprints[command] = fingerprint
+            merged.add(command)
+
+    manifest.save()
+
+    manuals = []
+    for command in manifest.fingerprints:
+        try:
+            manual_data = read_manual_file(XmlSerializer.manual_path(output_folder, command))
+        except (FileNotFoundError, ET.ParseError):
+            manual_data = store.get(command) if store is not None else None
+
+        if manual_data:
+            manuals.append(manual_data)
+
+    write_search_index(manuals, search_index_path(output_folder))
+
+    return len(merged)
+
+
+def read_manual_file(file_path):
+    # Load the XML file
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+
+    # The ManualRecord of the last 'CommandManual' element, None if the file has none
+    command_data = None
+    for command_manual_elem in root.findall('CommandManual'):
+        command_data = ManualRecord.from_element(command_manual_elem)
+
+    return command_data
+
+
+def find_manual(command, store=None, manuals_folder="manuals_folder"):
+    # (ManualRecord, None), or (None, message) when the command has no manual
+
+    if store is not None:
+        # The store keeps the manuals parsed, the XML parser is not needed
+        command_data = store.get(command)
+        if command_data is None:
+            return None, f"{command} not found in {store.path}"
+
+        return command_data, None
+
+    file_path = f"{manuals_folder}/{command}_manual.xml"
 
+    try:
+        command_data = read_manual_file(file_path)
     except FileNotFoundError:
-        return f"File not found: {file_path}"
+        return None, f"File not found: {file_path}"
+
+    if command_data is None:
+        return None, f"No manual in {file_path}"
+
+    return command_data, None
+
+
+def get_info_for_selection(command, selection, store=None, manuals_folder="manuals_folder"):
+    command_data, error = find_manual(command, store, manuals_folder)
+    if command_data is None:
+        return error
+
+    return format_selection(command_data, selection)
+
+
+# index file -> (identity of the file when it was opened, SearchIndex), reopened after a new generation
+search_indexes = {}
+search_indexes_lock = threading.Lock()
+
+
+def search_manuals(query, index_file=None, limit=20):
+    # Ranked list of (command, score) of the manuals that contain the words of the query, the index of the
+    # default output folder is read unless another index file is given
+    if index_file is None:
+        index_file = search_index_path()
+
+    identity = file_identity(index_file)
+    if identity == "-":
+        return f"File not found: {index_file}"
+
+    # The query runs under the lock too, so an index is never closed while another thread searches it
+    with search_indexes_lock:
+        entry = search_indexes.get(index_file)
+        if entry is None or entry[0] != identity:
+            if entry is not None:
+                # Unmaps the replaced file, a long-running GUI would keep one mapping per generation otherwise
+                entry[1].close()
+
+            entry = (identity, SearchIndex(index_file))
+            search_indexes[index_file] = entry
+
+        return entry[1].search(query, limit)
+
+
+def format_selection(command_data, selection):
+
+    if selection == "Show All Info":
+        keys_to_extract = ['CommandDescription', 'VersionHistory', 'Example', 'RelatedCommands', 'OnlineDocumentationLinks', 'RecommendedCommands']
+        formatted_output = ""
+        for key in keys_to_extract:
+            formatted_output += f"{key}: {command_data[key]}\n\n"
+
+        return formatted_output
+
+    elif selection == "Show Description":
+        return f"Command Description: {command_data['CommandDescription']}"
+
+    elif selection == "Show Version":
+        return f"Command Version: {command_data['VersionHistory']}"
+
+    elif selection == "Show Example":
+        return f"Command Example: {command_data['Example']}"
+
+    elif selection == "Show Related Commands":
+        return f"Command Related Commands: {command_data['RelatedCommands']}"
+
+    elif selection == "Show Online Documentation Links":
+        return f"Command Online Documentation Links: {command_data['OnlineDocumentationLinks']}"
+
+    elif selection == "Show Recommended Commands":
+        return f"Command Recommended Commands: {command_data['RecommendedCommands']}"
+
+    else:
+        return f"Invalid selection: {selection}"
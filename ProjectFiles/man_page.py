@@ -0,0 +1,94 @@
+class ManPage:
+    # The rendered text of a man page with the offsets of its sections, indexed in a single pass.
+    # Section headings are the only lines that are not indented, a section is its heading's following lines
+
+    def __init__(self, text):
+        self.text = text
+        self.headings = []  # section names in the order of the page
+        self.offsets = {}  # section name -> (start, end) of its body in text, the first one wins
+        self.index()
+
+    def index(self):
+        text = self.text
+        heading = None
+        body_start = 0
+        position = 0
+
+        while position < len(text):
+            line_end = text.find('\n', position)
+            if line_end == -1:
+                line_end = len(text)
+
+            if position < line_end and not text[position].isspace():
+                if heading is not None:
+                    self.add_section(heading, body_start, position)
+
+                heading = text[position:line_end].strip()
+                body_start = line_end + 1
+
+            position = line_end + 1
+
+        if heading is not None:
+            self.add_section(heading, body_start, len(text))
+
+    def add_section(self, heading, start, end):
+        if heading not in self.offsets:
+            self.headings.append(heading)
+            self.offsets[heading] = (min(start, len(self.text)), end)
+
+    def section(self, name):
+        # Body of the section as it is rendered, None if the page has no such section
+        offsets = self.offsets.get(name)
+        if offsets is None:
+            return None
+
+        start, end = offsets
+        return self.text[start:end]
+
+    def find_heading(self, prefix):
+        # First heading that starts with prefix, for headings that carry a value such as 'Version 1.2'
+        return next((heading for heading in self.headings if heading.startswith(prefix)), None)
+
+    def description(self):
+        # The whole DESCRIPTION section, every paragraph of it
+        body = self.section('DESCRIPTION')
+        return body.strip() if body is not None else None
+
+    def name_line(self):
+        # 'ls - list directory contents'
+        body = self.section('NAME')
+        return ' '.join(body.split()) if body is not None else None
+
+    def synopsis(self):
+        body = self.section('SYNOPSIS')
+        return body.strip() if body is not None else None
+
+    def version(self):
+        # Value of a 'Version ...' heading, as some pages print their version on a line of its own
+        heading = self.find_heading('Version')
+        if heading is None or ' ' not in heading:
+            return None
+
+        return heading.split(' ', 1)[1]
+
+    def options(self, name='OPTIONS'):
+        # [(flags, description)] of a section that lists options, like OPTIONS or DESCRIPTION for GNU pages
+        body = self.section(name)
+        if body is None:
+            return []
+
+        options = []
+        flags_indent = None
+        for line in body.split('\n'):
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            indent = len(line) - len(line.lstrip())
+            if stripped.startswith('-') and (flags_indent is None or indent <= flags_indent):
+                flags_indent = indent
+                options.append([stripped, []])
+            elif options and indent > flags_indent:
+                options[-1][1].append(stripped)
+
+        return [(flags, ' '.join(text)) for flags, text in options]
@@ -0,0 +1,100 @@
+import sys
+
+MANUAL_FIELDS = ['CommandName', 'CommandDescription', 'VersionHistory', 'Example', 'RelatedCommands',
+                 'OnlineDocumentationLinks', 'RecommendedCommands']
+FIELD_SET = frozenset(MANUAL_FIELDS)
+
+# Fields whose values repeat across many manuals (same bash version, same fallback texts), kept once in memory
+INTERNED_FIELDS = frozenset(['CommandName', 'VersionHistory', 'Example', 'RelatedCommands',
+                             'OnlineDocumentationLinks', 'RecommendedCommands'])
+
+
+class ManualRecord:
+    # Immutable manual of one command. Reads like a read-only dict of MANUAL_FIELDS so manual_data['Example'],
+    # keys(), items() and get() keep working, but holds the values in slots instead of a per-command dict
+
+    __slots__ = tuple(MANUAL_FIELDS) + ('hash_value',)
+
+    def __init__(self, *values):
+        if len(values) != len(MANUAL_FIELDS):
+            raise TypeError(f"ManualRecord takes {len(MANUAL_FIELDS)} values, got {len(values)}")
+
+        for field, value in zip(MANUAL_FIELDS, values):
+            if field in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            object.__setattr__(self, field, value)
+
+        object.__setattr__(self, 'hash_value', None)
+
+    @classmethod
+    def from_dict(cls, manual_data):
+        return cls(*(manual_data.get(field) for field in MANUAL_FIELDS))
+
+    @classmethod
+    def from_element(cls, element):
+        # Reads a CommandManual XML element in one pass over its children, empty elements give None
+        texts = {child.tag: child.text for child in element}
+        return cls(*(texts.get(field) for field in MANUAL_FIELDS))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ManualRecord is immutable, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError("ManualRecord is immutable")
+
+    def __reduce__(self):
+        return ManualRecord, self.values()
+
+    def replace(self, **changes):
+        # A copy with some fields changed
+        return ManualRecord(*(changes.get(field, getattr(self, field)) for field in MANUAL_FIELDS))
+
+    def values(self):
+        return tuple(getattr(self, field) for field in MANUAL_FIELDS)
+
+    def keys(self):
+        return list(MANUAL_FIELDS)
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in MANUAL_FIELDS]
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in FIELD_SET else default
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getitem__(self, field):
+        if field not in FIELD_SET:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        return field in FIELD_SET
+
+    def __iter__(self):
+        return iter(MANUAL_FIELDS)
+
+    def __len__(self):
+        return len(MANUAL_FIELDS)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, ManualRecord):
+            # Not equal to a dict of the same fields, a dict could not hash the same
+            return NotImplemented
+
+        # Hashing fresh strings costs more than comparing them, the hashes only settle it when both are known.
+        # Interned values are usually the same object, which makes most of the comparisons identity checks
+        if self.hash_value is not None and other.hash_value is not None and self.hash_value != other.hash_value:
+            return False
+        return self.values() == other.values()
+
+    def __hash__(self):
+        if self.hash_value is None:
+            object.__setattr__(self, 'hash_value', hash(self.values()))
+        return self.hash_value
+
+    def __repr__(self):
+        return f"ManualRecord({self.CommandName!r})"
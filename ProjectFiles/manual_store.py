@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from manual_record import MANUAL_FIELDS, ManualRecord
+
+# Most commands looked up by one prefetch query, below the SQLite limit of bound parameters
+PREFETCH_CHUNK = 500
+
+
+class ManualStore:
+    # All the manuals in one indexed SQLite file, with the most recently read ones kept parsed in memory
+
+    def __init__(self, path="manuals.sqlite", cache_size=1024):
+        self.path = path
+        self.cache_size = cache_size  # manuals kept in memory
+        self.cache = OrderedDict()  # command -> ManualRecord, least recently used first
+        self.names = None  # sorted command names, loaded once
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{field} TEXT" for field in MANUAL_FIELDS[1:])
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS manuals (CommandName TEXT PRIMARY KEY, {columns})")
+        self.connection.commit()
+
+    def get(self, command):
+        # Returns the ManualRecord of the command, or None if it is not in the store
+        with self.lock:
+            if command in self.cache:
+                self.cache.move_to_end(command)
+                return self.cache[command]
+
+            row = self.connection.execute(f"SELECT {', '.join(MANUAL_FIELDS)} FROM manuals WHERE CommandName = ?",
+                                          (command,)).fetchone()
+            if row is None:
+                return None
+
+            manual_data = ManualRecord(*row)
+            self.remember(command, manual_data)
+
+        return manual_data
+
+    def prefetch(self, commands):
+        # Loads the commands that are not in memory yet with one query per chunk, so the rows around the one a
+        # user looks at are already parsed when they get there
+        with self.lock:
+            missing = [command for command in dict.fromkeys(commands) if command not in self.cache]
+
+            for start in range(0, len(missing), PREFETCH_CHUNK):
+                chunk = missing[start:start + PREFETCH_CHUNK]
+                rows = self.connection.execute(f"SELECT {', '.join(MANUAL_FIELDS)} FROM manuals "
+                                               f"WHERE CommandName IN ({', '.join('?' for _ in chunk)})",
+                                               chunk).fetchall()
+                for row in rows:
+                    self.remember(row[0], ManualRecord(*row))
+
+    def put(self, manual_data):
+        self.put_many([manual_data])
+
+    def put_many(self, manuals):
+        # Stores many manuals in a single transaction
+        placeholders = ", ".join("?" for _ in MANUAL_FIELDS)
+
+        with self.lock:
+            with self.connection:
+                for manual_data in manuals:
+                    self.connection.execute(f"INSERT OR REPLACE INTO manuals ({', '.join(MANUAL_FIELDS)}) "
+                                            f"VALUES ({placeholders})",
+                                            [manual_data[field] for field in MANUAL_FIELDS])
+                    if not isinstance(manual_data, ManualRecord):
+                        manual_data = ManualRecord.from_dict(manual_data)
+                    self.remember(manual_data['CommandName'], manual_data)
+
+            self.names = None
+
+    def remember(self, command, manual_data):
+        self.cache[command] = manual_data
+        self.cache.move_to_end(command)
+
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def contains(self, command):
+        return self.get(command) is not None
+
+    def commands(self):
+        with self.lock:
+            if self.names is None:
+                rows = self.connection.execute("SELECT CommandName FROM manuals ORDER BY CommandName").fetchall()
+                self.names = [row[0] for row in rows]
+
+            return list(self.names)
+
+    def delete(self, command):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM manuals WHERE CommandName = ?", (command,))
+
+            self.cache.pop(command, None)
+            self.names = None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,265 @@
+import functools
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+
+
+MAN_DIRECTORIES = ["/usr/share/man", "/usr/local/share/man", "/usr/local/man", "/usr/man"]
+# Cache hits whose time of use is kept in memory before it is written
+USED_FLUSH_SIZE = 1024
+
+# Compression suffixes of man page files
+MAN_COMPRESSIONS = (".gz", ".bz2", ".xz", ".zst", ".lzma", ".Z")
+WHATIS_DATABASES = ["/var/cache/man/index.db", "/var/cache/man/whatis", "/usr/share/man/whatis"]
+
+
+def file_identity(path):
+    # Identity of a file that changes whenever the file is replaced or modified
+    if path is None:
+        return "-"
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "-"
+
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}:{stat.st_ino}"
+
+
+def whatis_identity():
+    whatis = next((path for path in WHATIS_DATABASES if os.path.exists(path)), None)
+    return file_identity(whatis)
+
+
+def command_identity(command, man_index):
+    # Identity of everything the probes of a command read: its binary, its man page and the whatis database
+    binary = shutil.which(command)
+
+    return "|".join([file_identity(binary), file_identity(man_index.find(command)), whatis_identity()])
+
+
+@functools.lru_cache(maxsize=None)
+def bash_version_output():
+    # 'bash --version' only changes when bash is upgraded, it runs once per process. None when bash is unusable
+    try:
+        return subprocess.check_output(['bash', '--version'], stdin=subprocess.DEVNULL, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def shell_builtins():
+    # Names of the bash builtins, listed once per process
+    try:
+        output = subprocess.check_output(['bash', '-c', 'compgen -b'], stdin=subprocess.DEVNULL, text=True,
+                                         timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+
+    return frozenset(output.split())
+
+
+class CommandResolver:
+    # Tells whether a command is a binary on PATH, a shell builtin or missing before anything is forked for it.
+    # Results are memoised, a missing command is looked up again once negative_ttl seconds have passed
+
+    def __init__(self, negative_ttl=300):
+        self.negative_ttl = negative_ttl
+        self.kinds = {}  # command -> (kind, time it was resolved)
+        self.lock = threading.Lock()
+
+    def resolve(self, command):
+        # Returns 'binary', 'builtin' or 'missing'
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.kinds.get(command)
+            if entry is not None and (entry[0] != 'missing' or now - entry[1] < self.negative_ttl):
+                return entry[0]
+
+        if shutil.which(command) is not None:
+            kind = 'binary'
+        elif command in shell_builtins():
+            kind = 'builtin'
+        else:
+            kind = 'missing'
+
+        with self.lock:
+            self.kinds[command] = (kind, now)
+
+        return kind
+
+    def is_binary(self, command):
+        return self.resolve(command) == 'binary'
+
+    def mark_missing(self, command):
+        # Called when running the command failed because its binary is gone
+        with self.lock:
+            self.kinds[command] = ('missing', time.monotonic())
+
+    def clear(self):
+        with self.lock:
+            self.kinds.clear()
+
+
+# Shared by every probe of the process, so a command is resolved once whatever run asks for it
+COMMAND_RESOLVER = CommandResolver()
+
+
+def man_page_name(file_name):
+    # ls.1.gz -> ls, mkfs.ext4.8.gz -> mkfs.ext4: only the compression suffix and the section are dropped
+    for suffix in MAN_COMPRESSIONS:
+        if file_name.endswith(suffix):
+            file_name = file_name[:-len(suffix)]
+            break
+
+    return file_name.rsplit(".", 1)[0]
+
+
+class ManPageIndex:
+    # Maps a command name to its man page file by listing the man directories once
+
+    def __init__(self, directories=None):
+        if directories is None:
+            manpath = os.environ.get("MANPATH")
+            directories = [d for d in manpath.split(":") if d] if manpath else MAN_DIRECTORIES
+        self.directories = directories
+        self.pages = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        pages = {}
+        for directory in self.directories:
+            try:
+                section_dirs = sorted(entry.path for entry in os.scandir(directory)
+                                      if entry.is_dir() and entry.name.startswith("man"))
+            except OSError:
+                continue
+
+            for section_dir in section_dirs:
+                try:
+                    entries = sorted(os.scandir(section_dir), key=lambda entry: entry.name)
+                except OSError:
+                    continue
+
+                for entry in entries:
+                    # Keep the first page found like man does
+                    pages.setdefault(man_page_name(entry.name), entry.path)
+
+        return pages
+
+    def find(self, command):
+        with self.lock:
+            if self.pages is None:
+                self.pages = self.load()
+
+        return self.pages.get(command)
+
+
+class ProbeCache:
+    # SQLite cache of probe outputs, keyed on the identity of the command's binary and man page
+
+    def __init__(self, path="probe_cache.sqlite", max_size=64 * 1024 * 1024, man_index=None):
+        self.path = path
+        self.max_size = max_size  # total bytes of cached output before the least recently used is evicted
+        self.man_index = man_index if man_index is not None else ManPageIndex()
+        self.lock = threading.Lock()
+        # key -> time of the last hit, written in one transaction by put, flush or close instead of one per hit
+        self.used = {}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " key TEXT PRIMARY KEY,"
+            " output TEXT,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)")
+        self.connection.commit()
+
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM probes").fetchone()[0]
+
+    def identity(self, command):
+        return command_identity(command, self.man_index)
+
+    @staticmethod
+    def make_key(command, name, identity):
+        return f"{command}\0{name}\0{identity}"
+
+    def get(self, key):
+        # Returns (found, output), output is None for a probe that exited with an error
+        with self.lock:
+            row = self.connection.execute("SELECT output FROM probes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+
+            self.used[key] = time.time()
+            if len(self.used) >= USED_FLUSH_SIZE:
+                self.write_used()
+                self.connection.commit()
+
+        return True, row[0]
+
+    def write_used(self):
+        # Records the hits kept in memory, the caller commits
+        if self.used:
+            self.connection.executemany("UPDATE probes SET last_used = ? WHERE key = ?",
+                                        ((last_used, key) for key, last_used in self.used.items()))
+            self.used.clear()
+
+    def flush(self):
+        with self.lock:
+            self.write_used()
+            self.connection.commit()
+
+    def put(self, key, output):
+        size = len(key) + (len(output) if output is not None else 0)
+
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM probes WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self.total_size -= previous[0]
+
+            self.connection.execute("INSERT OR REPLACE INTO probes (key, output, size, last_used) VALUES (?, ?, ?, ?)",
+                                    (key, output, size, time.time()))
+            self.total_size += size
+
+            # The eviction must see the recent hits
+            self.write_used()
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        # Drop the least recently used outputs until the cache fits in max_size
+        while self.total_size > self.max_size:
+            rows = self.connection.execute("SELECT key, size FROM probes ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                self.total_size = 0
+                break
+
+            for key, size in rows:
+                self.connection.execute("DELETE FROM probes WHERE key = ?", (key,))
+                self.total_size -= size
+                if self.total_size <= self.max_size:
+                    break
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM probes")
+            self.connection.commit()
+            self.used.clear()
+            self.total_size = 0
+
+    def close(self):
+        with self.lock:
+            self.write_used()
+            self.connection.commit()
+            self.connection.close()
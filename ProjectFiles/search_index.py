@@ -0,0 +1,198 @@
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+
+# Inverted index of the manuals in a single file that is memory-mapped for queries, so opening it reads nothing
+# and a query only touches the pages of the terms it asks for. Layout, all little endian:
+#   header
+#   documents: (name offset, name length) per manual
+#   norms: the BM25 length normalization of every manual, a float array read in place
+#   terms: (term offset, term length, postings offset, postings count) per term, sorted by term bytes
+#   postings: (document id, weighted term frequency) per term and manual
+#   strings: the UTF-8 command names and terms
+
+MAGIC = b"MANIDX01"
+HEADER = struct.Struct("<8sIIIIIII")  # magic, documents, terms, then the offsets of the five tables
+DOCUMENT = struct.Struct("<II")
+NORM = struct.Struct("<f")
+TERM = struct.Struct("<IIII")
+POSTING = struct.Struct("<If")
+
+# Fields searched and how much a word found in each of them counts
+SEARCH_FIELDS = {
+    'CommandName': 3.0,
+    'CommandDescription': 1.0,
+    'Example': 1.0,
+    'RelatedCommands': 0.5,
+}
+
+TOKEN = re.compile(r"[a-z0-9_]+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower()) if text else []
+
+
+class SearchIndexBuilder:
+    # Collects the manuals of a generation run, then writes the index file in one go
+
+    def __init__(self):
+        self.names = []
+        self.lengths = []
+        self.postings = {}  # term -> [(document id, weighted frequency)]
+
+    def add(self, manual_data):
+        document = len(self.names)
+        frequencies = {}
+        length = 0.0
+
+        for field, weight in SEARCH_FIELDS.items():
+            for term in tokenize(manual_data.get(field)):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+                length += weight
+
+        self.names.append(manual_data['CommandName'])
+        self.lengths.append(length)
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, []).append((document, frequency))
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        mean_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+        strings = bytearray()
+        documents = bytearray()
+        norms = bytearray()
+        for name, length in zip(self.names, self.lengths):
+            encoded = name.encode('utf-8')
+            documents += DOCUMENT.pack(len(strings), len(encoded))
+            norms += NORM.pack(K1 * (1 - B + B * length / mean_length) if mean_length else K1)
+            strings += encoded
+
+        terms = bytearray()
+        postings = bytearray()
+        for encoded, entries in sorted((term.encode('utf-8'), entries) for term, entries in self.postings.items()):
+            terms += TERM.pack(len(strings), len(encoded), len(postings) // POSTING.size, len(entries))
+            strings += encoded
+            for document, frequency in entries:
+                postings += POSTING.pack(document, frequency)
+
+        documents_offset = HEADER.size
+        norms_offset = documents_offset + len(documents)
+        terms_offset = norms_offset + len(norms)
+        postings_offset = terms_offset + len(terms)
+        strings_offset = postings_offset + len(postings)
+
+        # Written aside then swapped in, readers that mapped the previous file keep reading it safely
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(HEADER.pack(MAGIC, len(self.names), len(self.postings), documents_offset,
+                                         norms_offset, terms_offset, postings_offset, strings_offset))
+            index_file.write(documents)
+            index_file.write(norms)
+            index_file.write(terms)
+            index_file.write(postings)
+            index_file.write(strings)
+        os.replace(temp_path, path)
+
+
+class SearchIndex:
+    # Read side of the index file, thread safe, terms are found by binary search on the mapped term table
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self.map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.document_count, self.term_count, self.documents_offset, norms_offset, self.terms_offset,
+         self.postings_offset, self.strings_offset) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a manual search index")
+
+        # Read in place, the norms are only paged in when a query needs them
+        self.norms = memoryview(self.map)[norms_offset:norms_offset + self.document_count * NORM.size].cast('f')
+
+        self.lock = threading.Lock()
+
+    def string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.map[start:start + length]
+
+    def term_at(self, position):
+        return TERM.unpack_from(self.map, self.terms_offset + position * TERM.size)
+
+    def term_bytes(self, position):
+        offset, length, _, _ = self.term_at(position)
+        return self.string(offset, length)
+
+    def lower_bound(self, encoded):
+        # Position of the first term that is not smaller than encoded
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term_bytes(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def matching_terms(self, term, prefix=False, limit=64):
+        # Positions of the term itself, or of the first terms that start with it
+        encoded = term.encode('utf-8')
+        position = self.lower_bound(encoded)
+        positions = []
+
+        while position < self.term_count and len(positions) < limit:
+            current = self.term_bytes(position)
+            if current == encoded or (prefix and current.startswith(encoded)):
+                positions.append(position)
+                position += 1
+            else:
+                break
+
+        return positions
+
+    def command(self, document):
+        offset, length = DOCUMENT.unpack_from(self.map, self.documents_offset + document * DOCUMENT.size)
+        return self.string(offset, length).decode('utf-8')
+
+    def search(self, query, limit=20, prefix=True):
+        # Ranked [(command, score)] of the manuals that contain the words of the query (BM25).
+        # With prefix the last word also matches the words it starts, for search as you type
+        terms = tokenize(query)
+        if not terms or self.document_count == 0:
+            return []
+
+        scores = {}
+        norms = self.norms
+        with self.lock:
+            for i, term in enumerate(terms):
+                for position in self.matching_terms(term, prefix and i == len(terms) - 1):
+                    _, _, postings_start, count = self.term_at(position)
+                    weight = math.log(1 + (self.document_count - count + 0.5) / (count + 0.5)) * (K1 + 1)
+                    start = self.postings_offset + postings_start * POSTING.size
+
+                    for document, frequency in POSTING.iter_unpack(self.map[start:start + count * POSTING.size]):
+                        score = weight * frequency / (frequency + norms[document])
+                        scores[document] = scores.get(document, 0.0) + score
+
+            ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+            return [(self.command(document), score) for document, score in ranked]
+
+    def close(self):
+        with self.lock:
+            self.norms.release()
+            self.map.close()
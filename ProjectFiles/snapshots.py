@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import platform
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+
+from manual_record import MANUAL_FIELDS, ManualRecord
+from verification import ADDED, REMOVED, VerificationReport, VerificationResult, compare_manuals
+
+# Commands are spread over this many buckets. A snapshot is the list of its bucket hashes, buckets with the same
+# content are stored once for all the snapshots, and two snapshots are compared bucket by bucket
+BUCKETS = 256
+
+
+def content_hash(data):
+    return hashlib.sha256(data).digest()[:16]
+
+
+def value_hash(value):
+    # None and '' are different values, an empty XML element reads as None
+    return content_hash(b"\x00" if value is None else b"\x01" + value.encode('utf-8'))
+
+
+def command_bucket(command):
+    return zlib.crc32(command.encode('utf-8')) % BUCKETS
+
+
+def read_os_release():
+    try:
+        with open("/etc/os-release", 'r') as os_release:
+            for line in os_release:
+                key, _, value = line.strip().partition('=')
+                if key == "PRETTY_NAME":
+                    return value.strip('"')
+    except OSError:
+        pass
+
+    return f"{platform.system()} {platform.release()}"
+
+
+def environment_tag(label=None):
+    # Where and when a generation run happened
+    hostname = socket.gethostname()
+    distro = read_os_release()
+    created = time.time()
+
+    return {
+        'label': label or f"{hostname} {distro} {time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(created))}",
+        'hostname': hostname,
+        'distro': distro,
+        'kernel': platform.release(),
+        'created': created,
+    }
+
+
+class SnapshotStore:
+    # Manuals of many hosts and runs in one SQLite file. Every field value is stored once under its hash, every
+    # manual once as the hashes of its fields, and every bucket of (command, manual hash) once, so the snapshots
+    # of hosts that mostly agree take little more room than one
+
+    def __init__(self, path="snapshots.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        field_columns = ", ".join(f"{field} BLOB" for field in MANUAL_FIELDS)
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS blobs (hash BLOB PRIMARY KEY, value TEXT) WITHOUT ROWID;"
+            f"CREATE TABLE IF NOT EXISTS records (hash BLOB PRIMARY KEY, {field_columns}) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS bucket_entries (bucket_hash BLOB, command TEXT, record BLOB,"
+            " PRIMARY KEY (bucket_hash, command)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS snapshot_buckets (snapshot INTEGER, bucket INTEGER, bucket_hash BLOB,"
+            " PRIMARY KEY (snapshot, bucket)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY AUTOINCREMENT, label TEXT, hostname TEXT,"
+            " distro TEXT, created REAL, environment TEXT, root BLOB, commands INTEGER);"
+        )
+        self.connection.commit()
+
+    def record_snapshot(self, manuals, environment=None):
+        # Stores the ManualRecords of a run under its environment tag, returns the id of the snapshot
+        environment = environment if environment is not None else environment_tag()
+
+        blobs = {}
+        records = {}
+        buckets = {}  # bucket -> [(command, record hash)]
+        for manual_data in manuals:
+            field_hashes = []
+            for field in MANUAL_FIELDS:
+                value = manual_data[field]
+                digest = value_hash(value)
+                blobs[digest] = value
+                field_hashes.append(digest)
+
+            record = content_hash(b"".join(field_hashes))
+            records[record] = field_hashes
+            command = manual_data['CommandName']
+            buckets.setdefault(command_bucket(command), []).append((command, record))
+
+        bucket_hashes = {}
+        for bucket, entries in buckets.items():
+            entries.sort()
+            bucket_hashes[bucket] = content_hash(b"".join(command.encode('utf-8') + b"\x00" + record
+                                                          for command, record in entries))
+
+        root = content_hash(b"".join(bucket.to_bytes(2, 'little') + bucket_hashes[bucket]
+                                     for bucket in sorted(bucket_hashes)))
+
+        with self.lock:
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO blobs (hash, value) VALUES (?, ?)",
+                                            blobs.items())
+                self.connection.executemany(
+                    f"INSERT OR IGNORE INTO records (hash, {', '.join(MANUAL_FIELDS)}) "
+                    f"VALUES (?{', ?' * len(MANUAL_FIELDS)})",
+                    ([record] + field_hashes for record, field_hashes in records.items()))
+
+                for bucket, entries in buckets.items():
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO bucket_entries (bucket_hash, command, record) VALUES (?, ?, ?)",
+                        ((bucket_hashes[bucket], command, record) for command, record in entries))
+
+                cursor = self.connection.execute(
+                    "INSERT INTO snapshots (label, hostname, distro, created, environment, root, commands) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (environment.get('label'), environment.get('hostname'), environment.get('distro'),
+                     environment.get('created', time.time()), json.dumps(environment), root,
+                     sum(len(entries) for entries in buckets.values())))
+                snapshot = cursor.lastrowid
+
+                self.connection.executemany(
+                    "INSERT INTO snapshot_buckets (snapshot, bucket, bucket_hash) VALUES (?, ?, ?)",
+                    ((snapshot, bucket, bucket_hash) for bucket, bucket_hash in bucket_hashes.items()))
+
+        return snapshot
+
+    def snapshots(self):
+        # Every snapshot, oldest first, as dictionaries of its environment tag
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, label, hostname, distro, created, commands FROM snapshots ORDER BY id").fetchall()
+
+        return [{'id': row[0], 'label': row[1], 'hostname': row[2], 'distro': row[3], 'created': row[4],
+                 'commands': row[5]} for row in rows]
+
+    def find(self, name):
+        # Snapshot id of an id or a label, the latest snapshot with that label wins
+        with self.lock:
+            row = self.connection.execute("SELECT id FROM snapshots WHERE CAST(id AS TEXT) = ? OR label = ? "
+                                          "ORDER BY id DESC LIMIT 1", (str(name), str(name))).fetchone()
+
+        if row is None:
+            raise KeyError(f"No snapshot {name!r} in {self.path}")
+
+        return row[0]
+
+    def bucket_hashes(self, snapshot):
+        rows = self.connection.execute("SELECT bucket, bucket_hash FROM snapshot_buckets WHERE snapshot = ?",
+                                       (snapshot,)).fetchall()
+        return dict(rows)
+
+    def bucket_entries(self, bucket_hash):
+        if bucket_hash is None:
+            return {}
+
+        rows = self.connection.execute("SELECT command, record FROM bucket_entries WHERE bucket_hash = ?",
+                                       (bucket_hash,)).fetchall()
+        return dict(rows)
+
+    def load_record(self, record):
+        # ManualRecord of a record hash
+        field_hashes = self.connection.execute(f"SELECT {', '.join(MANUAL_FIELDS)} FROM records WHERE hash = ?",
+                                               (record,)).fetchone()
+        return ManualRecord(*(self.blob(digest) for digest in field_hashes))
+
+    def get(self, snapshot, command):
+        # ManualRecord of a command in a snapshot, None if the snapshot does not have it
+        with self.lock:
+            row = self.connection.execute("SELECT bucket_hash FROM snapshot_buckets WHERE snapshot = ? AND bucket = ?",
+                                          (snapshot, command_bucket(command))).fetchone()
+            if row is None:
+                return None
+
+            record = self.bucket_entries(row[0]).get(command)
+            return self.load_record(record) if record is not None else None
+
+    def changed_commands(self, old, new):
+        # [(command, old record hash or None, new record hash or None)] of the commands that differ.
+        # Only the buckets whose hash differs are read, identical snapshots cost a single comparison
+        with self.lock:
+            roots = dict(self.connection.execute("SELECT id, root FROM snapshots WHERE id IN (?, ?)",
+                                                 (old, new)).fetchall())
+            if old == new or roots.get(old) == roots.get(new):
+                return []
+
+            old_buckets = self.bucket_hashes(old)
+            new_buckets = self.bucket_hashes(new)
+
+            changes = []
+            for bucket in sorted(set(old_buckets) | set(new_buckets)):
+                if old_buckets.get(bucket) == new_buckets.get(bucket):
+                    continue
+
+                old_entries = self.bucket_entries(old_buckets.get(bucket))
+                new_entries = self.bucket_entries(new_buckets.get(bucket))
+                for command in sorted(set(old_entries) | set(new_entries)):
+                    if old_entries.get(command) != new_entries.get(command):
+                        changes.append((command, old_entries.get(command), new_entries.get(command)))
+
+            return changes
+
+    def diff(self, old, new):
+        # VerificationReport of the commands that changed from snapshot old to snapshot new, per field
+        report = VerificationReport()
+
+        for command, old_record, new_record in self.changed_commands(old, new):
+            if old_record is None:
+                report.add(VerificationResult(command, ADDED))
+            elif new_record is None:
+                report.add(VerificationResult(command, REMOVED))
+            else:
+                with self.lock:
+                    old_manual = self.load_record(old_record)
+                    new_manual = self.load_record(new_record)
+                report.add(compare_manuals(old_manual, new_manual))
+
+        return report
+
+    def drift(self, snapshots, field='VersionHistory'):
+        # command -> {value: [snapshot ids]} for the commands whose field differs between the given snapshots.
+        # Buckets and manuals shared by many snapshots are read once
+        if field not in MANUAL_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+
+        with self.lock:
+            entries = {}  # bucket hash -> {command: record hash}
+            field_hashes = {}  # record hash -> hash of its field value
+            values = {}  # command -> {value hash: [snapshot ids]}
+
+            for snapshot in snapshots:
+                for bucket_hash in self.bucket_hashes(snapshot).values():
+                    if bucket_hash not in entries:
+                        entries[bucket_hash] = self.bucket_entries(bucket_hash)
+
+                    for command, record in entries[bucket_hash].items():
+                        if record not in field_hashes:
+                            field_hashes[record] = self.connection.execute(
+                                f"SELECT {field} FROM records WHERE hash = ?", (record,)).fetchone()[0]
+
+                        values.setdefault(command, {}).setdefault(field_hashes[record], []).append(snapshot)
+
+            drift = {}
+            for command, by_value in sorted(values.items()):
+                if len(by_value) > 1:
+                    drift[command] = {self.blob(digest): snapshot_ids for digest, snapshot_ids in by_value.items()}
+
+            return drift
+
+    def blob(self, digest):
+        return self.connection.execute("SELECT value FROM blobs WHERE hash = ?", (digest,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,100 @@
+import heapq
+import json
+import threading
+import time
+
+
+class ProbeTracer:
+    # Records one event per probe and per generated field, and summarises the slowest commands and probes.
+    # Pass it to CommandManualGenerator or ManualVerifier, without a tracer nothing is recorded at all
+
+    def __init__(self, callback=None, jsonl_path=None, top=10):
+        self.callback = callback  # optional function called with every event dictionary
+        self.jsonl_file = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self.top = top  # entries kept in the summary lists
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.command_totals = {}  # command -> seconds spent in its probes
+        self.probe_totals = {}  # probe name -> {count, total_s, max_s}
+        self.slowest = []  # heap of (duration, sequence, event) of the slowest single probes
+        self.sequence = 0
+
+    def probe(self, command, name, started, status, output, source):
+        # source is where the output came from: 'run', 'cache' or 'index'
+        duration = time.perf_counter() - started
+        event = {
+            'event': 'probe',
+            'command': command,
+            'probe': name,
+            'source': source,
+            'duration_s': duration,
+            'exit_status': status,
+            'output_bytes': len(output) if output else 0,
+        }
+
+        with self.lock:
+            self.command_totals[command] = self.command_totals.get(command, 0) + duration
+
+            totals = self.probe_totals.setdefault(name, {'count': 0, 'total_s': 0, 'max_s': 0})
+            totals['count'] += 1
+            totals['total_s'] += duration
+            totals['max_s'] = max(totals['max_s'], duration)
+
+            self.sequence += 1
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, (duration, self.sequence, event))
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, self.sequence, event))
+
+        self.emit(event)
+
+    def field(self, command, field, started, path):
+        # path lists the probes tried for the field in order, the last one gave the value
+        self.emit({
+            'event': 'field',
+            'command': command,
+            'field': field,
+            'duration_s': time.perf_counter() - started,
+            'path': path,
+        })
+
+    def summary(self):
+        with self.lock:
+            slowest_commands = heapq.nlargest(self.top, self.command_totals.items(), key=lambda item: item[1])
+
+            return {
+                'event': 'summary',
+                'commands': len(self.command_totals),
+                'slowest_commands': [{'command': command, 'probe_time_s': total}
+                                     for command, total in slowest_commands],
+                'slowest_probes': [event for _, _, event in sorted(self.slowest, reverse=True)],
+                'probes': {name: dict(totals, mean_s=totals['total_s'] / totals['count'])
+                           for name, totals in sorted(self.probe_totals.items())},
+            }
+
+    def end_run(self):
+        # Emits the summary of the run and starts a new one
+        summary = self.summary()
+        self.emit(summary)
+
+        with self.lock:
+            self.reset()
+
+        return summary
+
+    def emit(self, event):
+        if self.callback is not None:
+            self.callback(event)
+
+        if self.jsonl_file is not None:
+            line = json.dumps(event)
+            with self.lock:
+                self.jsonl_file.write(line + '\n')
+                self.jsonl_file.flush()
+
+    def close(self):
+        if self.jsonl_file is not None:
+            self.jsonl_file.close()
+            self.jsonl_file = None
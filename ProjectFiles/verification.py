@@ -0,0 +1,231 @@
+import json
+import xml.etree.ElementTree as ET
+
+from manual_record import MANUAL_FIELDS
+
+# Kinds of change of a field, whitespace only changes do not fail the verification
+UNCHANGED = 'unchanged'
+WHITESPACE = 'whitespace'
+CHANGED = 'changed'
+ADDED = 'added'  # the field was empty in the existing manual
+REMOVED = 'removed'  # the field is empty in the generated manual
+
+FAILING_CHANGES = (CHANGED, ADDED, REMOVED)
+
+# Status of a verified command
+VERIFIED = 'verified'
+MISMATCH = 'mismatch'
+ERROR = 'error'  # the manual could not be read or the command could not be probed
+# Statuses of a command found on one side only when two sets of manuals are compared, like two snapshots.
+# ADDED and REMOVED are also change kinds of a field
+PRESENCE_STATUSES = (ADDED, REMOVED)
+
+
+def normalize(value):
+    # Collapses every run of whitespace, so re-indented or re-wrapped text compares equal
+    return ' '.join(value.split()) if value else ''
+
+
+def field_change(existing_value, generated_value):
+    if existing_value == generated_value:
+        return UNCHANGED
+
+    existing_text = normalize(existing_value)
+    generated_text = normalize(generated_value)
+
+    if existing_text == generated_text:
+        return WHITESPACE
+    elif not existing_text:
+        return ADDED
+    elif not generated_text:
+        return REMOVED
+    else:
+        return CHANGED
+
+
+class FieldChange:
+    __slots__ = ('field', 'change', 'existing', 'generated')
+
+    def __init__(self, field, change, existing, generated):
+        self.field = field
+        self.change = change
+        self.existing = existing
+        self.generated = generated
+
+    @property
+    def failed(self):
+        return self.change in FAILING_CHANGES
+
+    def to_dict(self):
+        return {'field': self.field, 'change': self.change, 'existing': self.existing, 'generated': self.generated}
+
+
+class VerificationResult:
+    # Outcome of the verification of one command, changes only lists the fields that differ
+
+    __slots__ = ('command', 'status', 'changes', 'error')
+
+    def __init__(self, command, status, changes=(), error=None):
+        self.command = command
+        self.status = status
+        self.changes = list(changes)
+        self.error = error
+
+    @classmethod
+    def failure(cls, command, error):
+        return cls(command, ERROR, error=error)
+
+    @property
+    def ok(self):
+        return self.status == VERIFIED
+
+    def failed_changes(self):
+        return [change for change in self.changes if change.failed]
+
+    def message(self):
+        # The text the verifier always printed for a command
+        if self.status == ERROR:
+            return f"\n{self.command}: {self.error}"
+        elif self.status in PRESENCE_STATUSES:
+            return f"\n{self.command}: {self.status}"
+
+        message = f"\n{self.command}: "
+        if self.ok:
+            return message + "verified successfully"
+
+        for change in self.failed_changes():
+            message += f"{change.field}: Content has changed\n\n" \
+                       f"  Existing Content: {change.existing}\n\n" \
+                       f"  Generated Content: {change.generated}\n\n"
+
+        return message
+
+    def to_dict(self):
+        return {
+            'command': self.command,
+            'status': self.status,
+            'error': self.error,
+            'changes': [change.to_dict() for change in self.changes],
+        }
+
+
+def compare_manuals(existing_content, generated_content):
+    # VerificationResult of the two ManualRecords of a command
+    command = existing_content['CommandName']
+
+    # Equal records usually share their interned values, so this is mostly identity checks
+    if existing_content == generated_content:
+        return VerificationResult(command, VERIFIED)
+
+    changes = []
+    for field in MANUAL_FIELDS:
+        existing_value = existing_content.get(field)
+        generated_value = generated_content.get(field)
+
+        change = field_change(existing_value, generated_value)
+        if change != UNCHANGED:
+            changes.append(FieldChange(field, change, existing_value, generated_value))
+
+    failed = any(change.failed for change in changes)
+    return VerificationResult(command, MISMATCH if failed else VERIFIED, changes)
+
+
+class VerificationReport:
+    # All the results of a verification run, with per field totals and JSON and JUnit output
+
+    def __init__(self, results=None, error=None):
+        self.results = results if results is not None else []
+        self.error = error  # set when nothing could be verified at all, like manuals that were never generated
+
+    def add(self, result):
+        self.results.append(result)
+
+    def passed(self):
+        return [result for result in self.results if result.ok]
+
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def ok(self):
+        return self.error is None and all(result.ok for result in self.results)
+
+    def counts(self):
+        # Added and removed commands only appear in the counts of comparisons that have them
+        counts = {VERIFIED: 0, MISMATCH: 0, ERROR: 0}
+        for result in self.results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        return counts
+
+    def by_field(self):
+        # field -> change kind -> number of commands, shows which fields drift across the catalogue
+        totals = {}
+        for result in self.results:
+            for change in result.changes:
+                field_totals = totals.setdefault(change.field, {})
+                field_totals[change.change] = field_totals.get(change.change, 0) + 1
+
+        return {field: totals[field] for field in MANUAL_FIELDS if field in totals}
+
+    def messages(self):
+        if self.error is not None:
+            return [self.error]
+
+        return [result.message() for result in self.results]
+
+    def summary(self):
+        counts = self.counts()
+        text = f"{counts[VERIFIED]} verified, {counts[MISMATCH]} changed, {counts[ERROR]} errors"
+        for status in PRESENCE_STATUSES:
+            if status in counts:
+                text += f", {counts[status]} {status}"
+
+        for field, changes in self.by_field().items():
+            text += f"\n  {field}: " + ", ".join(f"{count} {change}" for change, count in sorted(changes.items()))
+
+        return text
+
+    def to_dict(self):
+        return {
+            'error': self.error,
+            'counts': self.counts(),
+            'fields': self.by_field(),
+            'results': [result.to_dict() for result in self.results if not result.ok or result.changes],
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_junit(self, suite_name="manual-verification"):
+        counts = self.counts()
+        failures = counts[MISMATCH] + sum(counts.get(status, 0) for status in PRESENCE_STATUSES)
+        suite = ET.Element('testsuite', name=suite_name, tests=str(len(self.results)),
+                           failures=str(failures), errors=str(counts[ERROR] + (self.error is not None)))
+
+        if self.error is not None:
+            ET.SubElement(ET.SubElement(suite, 'testcase', classname=suite_name, name='manuals'), 'error',
+                          message=self.error)
+
+        for result in self.results:
+            case = ET.SubElement(suite, 'testcase', classname=suite_name, name=result.command)
+
+            if result.status == ERROR:
+                ET.SubElement(case, 'error', message=result.error)
+            elif result.status == MISMATCH:
+                failed = result.failed_changes()
+                failure = ET.SubElement(case, 'failure',
+                                        message=", ".join(f"{change.field} {change.change}" for change in failed))
+                failure.text = result.message().strip()
+            elif result.status in PRESENCE_STATUSES:
+                ET.SubElement(case, 'failure', message=result.status)
+
+        return ET.tostring(suite, encoding='unicode')
+
+    def write(self, path, report_format):
+        # report_format is 'json' or 'junit'
+        content = self.to_junit() if report_format == 'junit' else self.to_json()
+
+        with open(path, 'w', encoding='utf-8') as report_file:
+            if report_format == 'junit':
+                report_file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            report_file.write(content + '\n')